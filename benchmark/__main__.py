@@ -0,0 +1,329 @@
+"""
+Offline benchmark suite for Huizenjacht.
+
+Runs every stage of a poll cycle against a local stand-in for funda.nl and the Pushover API, so no live service is
+contacted. Search pages are taken from benchmark/corpus (recorded pages, *.html or *.html.gz), or generated if the
+corpus is empty.
+
+Usage:
+    python -m benchmark [--quick] [--output results.json] [--compare previous.json]
+    python -m benchmark --record name --configfile huizenjacht.yaml
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import chump
+
+from benchmark import corpus
+from benchmark.fake_comm import FakeComm
+from benchmark.stub_server import StubServer
+from huizenjacht.comm import Dispatcher
+from huizenjacht.config import Config
+from huizenjacht.fetch import Fetcher
+from huizenjacht.source import Funda
+from huizenjacht.store import Outbox, SeenStore, connect, listing_key
+
+REPO_ROOT = Path(__file__).parent.parent
+
+BENCH_CONF = """
+server:
+  debug: false
+  simulate: false
+  db: "{db}"
+  poll_time_min: 240
+  poll_time_max: 360
+  message_strings:
+    default_title: "Nieuw huis gevonden"
+    default_title_plural: "Nieuwe huizen gevonden"
+    server_info_msg_title: "Systeemmelding"
+    server_startup_msg_text: "De huizenjager is (opnieuw) opgestart"
+    server_shutdown_msg_text: "De huizenjager is gestopt"
+    and: "en"
+  outbox:
+    interval: 0.05
+  fetch:  # the stub server does not need to be protected
+    rate: 1000000
+    max_rate: 1000000
+    burst: 1000000
+sources:
+  funda:
+    active: true
+    area: "enschede"
+    areas: ["enschede"]
+    buy_or_rent: "rent"
+    property_type: ["woonhuis", "appartement"]
+    max_pages: 3
+comm:
+  pushover:
+    active: true
+    api_key: "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+    user_key: "uuuuuuuuuuuuuuuuuuuuuuuuuuuuuu"
+    digest_window: 0
+"""
+
+
+def measure(fn, repeat: int) -> dict:
+    """Call fn repeatedly and summarise its latency"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarise(latencies)
+
+
+def summarise(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "n": len(latencies),
+        "ops_per_s": len(latencies) / sum(latencies) if sum(latencies) > 0 else float("inf"),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000,
+    }
+
+
+def load_daemon_module():
+    """Import huizenjacht.py, which is shadowed by the huizenjacht package of the same name"""
+    spec = importlib.util.spec_from_file_location("huizenjacht_daemon", REPO_ROOT / "huizenjacht.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_fetch(stub: StubServer, repeat: int) -> dict:
+    fetcher = Fetcher()
+    url = f"{stub.url}/zoeken/huur"
+    return {
+        "fetch_full": measure(lambda: fetcher.get(url, conditional=False), repeat),
+        "fetch_not_modified": measure(lambda: fetcher.get(url), repeat),
+    }
+
+
+def bench_parse(funda: Funda, pages: dict[str, str], repeat: int) -> dict:
+    results = {}
+    for name, page in pages.items():
+        results[f"parse[{name}]"] = measure(lambda: funda._parse_response(page), repeat)
+    return results
+
+
+def bench_dedup(tmp: Path, sizes: list[int], repeat: int) -> dict:
+    def url(i: int) -> str:
+        return f"https://www.funda.nl/detail/huur/enschede/huis-straat-1/{10 ** 7 + i}/"
+
+    results = {}
+    server_conf = Config().config["server"]
+    for size in sizes:
+        db_file = tmp / f"dedup-{size}.db"
+        conn = connect(str(db_file))
+        server_conf["seen_index"] = {"mode": "none"}
+        SeenStore(conn, "Funda")  # Create table
+        conn.executemany('INSERT INTO "Funda" (id, URL) VALUES (?, ?)',
+                         ((listing_key(url(i)), url(i)) for i in range(size)))
+        conn.commit()
+
+        for mode in ("set", "none"):
+            server_conf["seen_index"] = {"mode": mode}
+            start = time.perf_counter()
+            store = SeenStore(conn, "Funda")
+            warmup = time.perf_counter() - start
+
+            # A typical page: everything seen before except for a single new listing
+            counter = iter(range(size, size + repeat))
+            seen = [url(i) for i in range(size - 14, size)]
+            result = measure(lambda: store.filter_new(seen + [url(next(counter))]), repeat)
+            result["db_bytes"] = db_file.stat().st_size
+            result["warmup_ms"] = warmup * 1000
+            results[f"dedup[{size},index={mode}]"] = result
+        conn.close()
+    server_conf.pop("seen_index", None)
+    return results
+
+
+def bench_dispatch(tmp: Path, repeat: int) -> dict:
+    """Delay between queueing a notification and its delivery to a comm, without any network involved"""
+    comm = FakeComm()
+    outbox = Outbox(connect(str(tmp / "dispatch.db")))
+    dispatcher = Dispatcher(outbox, [comm], lambda c, msg, title, url: c.send(msg, title, url))
+    dispatcher.start()
+
+    latencies = []
+    try:
+        for i in range(repeat):
+            comm.event.clear()
+            start = time.perf_counter()
+            outbox.enqueue([type(comm).__name__], "bench", "bench", f"https://www.funda.nl/detail/{i}/")
+            dispatcher.wake()
+            if comm.event.wait(10):
+                latencies.append(comm.sent[-1][0] - start)
+    finally:
+        dispatcher.stop(timeout=5)
+
+    return {"dispatch": summarise(latencies)}
+
+
+def bench_cycle(stub: StubServer, repeat: int) -> dict:
+    daemon = load_daemon_module()
+    hj = daemon.Huizenjacht(connect(Config().config["server"]["db"]))
+    stub.state.message_event.wait(5)  # Startup message
+
+    run_latencies, notify_latencies = [], []
+    try:
+        for i in range(repeat):
+            stub.state.publish(2 if i % 2 == 0 else 0)  # Every other cycle has new houses
+            stub.state.message_event.clear()
+            hj.scheduler.reset()
+
+            start = time.perf_counter()
+            hj.run()
+            run_latencies.append(time.perf_counter() - start)
+
+            if i % 2 == 0 and stub.state.message_event.wait(10):
+                notify_latencies.append(stub.state.messages[-1][0] - start)
+    finally:
+        hj.close()
+
+    return {
+        "cycle_run": summarise(run_latencies),
+        "cycle_notify": summarise(notify_latencies) if notify_latencies else {},
+    }
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import importlib.util
+spec = importlib.util.spec_from_file_location("huizenjacht_daemon", {daemon!r})
+daemon = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(daemon)
+import chump
+chump.ENDPOINT = {endpoint!r}
+daemon.Config(config_file={conf!r})
+hj = daemon.Huizenjacht(daemon.connect(daemon.Config().config["server"]["db"]))
+print(time.perf_counter() - start)
+hj.close()
+"""
+
+
+def bench_startup(stub: StubServer, tmp: Path, repeat: int) -> dict:
+    """Time from interpreter start to the point where the daemon reports READY=1, each run in a fresh process"""
+    conf_file = tmp / "startup.yaml"
+    conf_file.write_text(BENCH_CONF.format(db=tmp / "startup.db"))
+    script = STARTUP_SCRIPT.format(root=str(REPO_ROOT), daemon=str(REPO_ROOT / "huizenjacht.py"),
+                                   endpoint=f"{stub.url}/1/", conf=str(conf_file))
+
+    def run() -> float:
+        out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        return float(out.strip().splitlines()[-1])
+
+    cold = run()  # Creates the database and the User-Agent pool
+    return {
+        "startup_first": summarise([cold]),
+        "startup": summarise([run() for _ in range(repeat)]),
+    }
+
+
+def compare(results: dict, previous: dict):
+    print(f"\nCompared to {previous['version']} ({previous['timestamp']}):")
+    for name, result in results["results"].items():
+        old = previous["results"].get(name)
+        if not old or not result:
+            continue
+        change = (result["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100 if old["p50_ms"] else 0
+        print(f"  {name:40s} p50 {old['p50_ms']:10.3f} -> {result['p50_ms']:10.3f} ms ({change:+.1f}%)")
+
+
+def record(name: str, configfile: str):
+    """Record the live search page of the configured Funda source into the corpus"""
+    Config(config_file=configfile)
+    funda = Funda(sqlite3.connect(":memory:"), "funda")
+    page = funda._do_request()
+    if page is None:
+        sys.exit("Could not fetch the Funda search page")
+    corpus.record(name, page)
+    print(f"Recorded {len(page)} characters as {name}")
+
+
+def version() -> str:
+    try:
+        rev = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_ROOT,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return rev or "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Offline Huizenjacht benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Fewer repetitions and only the smallest database")
+    parser.add_argument("--dedup-sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Number of rows in the dedup database")
+    parser.add_argument("--output", "-o", type=str, help="Save results as JSON")
+    parser.add_argument("--compare", type=str, help="Compare with results saved earlier")
+    parser.add_argument("--record", type=str, metavar="NAME", help="Record a live search page into the corpus")
+    parser.add_argument("--configfile", "-c", type=str, default="/etc/huizenjacht.yaml",
+                        help="Configuration file used for --record")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.record:
+        record(args.record, args.configfile)
+        return 0
+
+    repeat = 20 if args.quick else 200
+    sizes = args.dedup_sizes[:1] if args.quick else args.dedup_sizes
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer() as stub:
+        tmp = Path(tmp)
+        Config().load_text(BENCH_CONF.format(db=tmp / "huizenjacht.db"))
+        Funda.BASE_URL = f"{stub.url}/zoeken/"
+        chump.ENDPOINT = f"{stub.url}/1/"
+
+        pages = corpus.pages_or_synthetic()
+        results = {}
+        results.update(bench_fetch(stub, repeat))
+        results.update(bench_parse(Funda(sqlite3.connect(":memory:"), "funda"), pages, repeat))
+        results.update(bench_dedup(tmp, sizes, repeat))
+        results.update(bench_dispatch(tmp, repeat))
+        results.update(bench_cycle(stub, max(repeat // 10, 4)))
+        results.update(bench_startup(stub, tmp, max(repeat // 20, 3)))
+
+    output = {
+        "version": version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "corpus": sorted(pages.keys()),
+        "results": results,
+    }
+
+    for name, result in results.items():
+        if result:
+            print(f"{name:40s} {result['ops_per_s']:12.1f} ops/s  p50 {result['p50_ms']:10.3f} ms  "
+                  f"p95 {result['p95_ms']:10.3f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(output, json.load(f))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
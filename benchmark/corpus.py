@@ -0,0 +1,66 @@
+import gzip
+import json
+import random
+from pathlib import Path
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+
+def load_pages(corpus_dir: Path = CORPUS_DIR) -> dict[str, str]:
+    """Load all recorded search pages (*.html or *.html.gz) from the corpus directory"""
+    pages = {}
+    for path in sorted(corpus_dir.glob("*.html*")):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            pages[path.name] = f.read()
+    return pages
+
+
+def synthetic_page(listing_ids: list[int], filler_cards: int = 400, seed: int = 0) -> str:
+    """Build a page that is shaped like a Funda search result page, for when no recorded pages are available"""
+    rnd = random.Random(seed)
+    ld_json = {
+        "@context": "https://schema.org",
+        "@type": "ItemList",
+        "itemListElement": [
+            {
+                "@type": "ListItem",
+                "position": i + 1,
+                "url": f"https://www.funda.nl/detail/huur/enschede/huis-{listing_id}/",
+            }
+            for i, listing_id in enumerate(listing_ids)
+        ],
+    }
+    listed = "".join(
+        f'<div class="search-result"><a href="/detail/huur/enschede/huis-{listing_id}/">'
+        f'<h2>Straat {listing_id}</h2></a><span class="price">&euro; {rnd.randint(500, 2500)} /maand</span>'
+        f'{"<span class=label>Onder bod</span>" if rnd.random() < 0.1 else ""}</div>'
+        for listing_id in listing_ids
+    )
+    cards = listed + "".join(
+        f'<div class="search-result"><a href="/detail/huur/enschede/huis-{rnd.randint(10 ** 7, 10 ** 8)}/">'
+        f'<h2>Straat {i}</h2></a><span class="price">&euro; {rnd.randint(500, 2500)} /maand</span>'
+        f'<ul class="kenmerken"><li>{rnd.randint(30, 200)} m&sup2;</li><li>{rnd.randint(1, 6)} kamers</li></ul></div>'
+        for i in range(filler_cards)
+    )
+    return (
+        '<!DOCTYPE html><html lang="nl"><head><meta charset="utf-8"><title>Huurwoningen in Enschede</title>'
+        '<script>window.__NUXT__={};</script>'
+        f'<script type="application/ld+json">{json.dumps(ld_json)}</script>'
+        f'</head><body><main>{cards}</main></body></html>'
+    )
+
+
+def pages_or_synthetic(count: int = 5) -> dict[str, str]:
+    """Recorded pages if there are any, synthetic ones otherwise"""
+    pages = load_pages()
+    if len(pages) > 0:
+        return pages
+    return {f"synthetic-{i}.html": synthetic_page(list(range(10 ** 7 + i * 15, 10 ** 7 + i * 15 + 15)), seed=i) for i in range(count)}
+
+
+def record(name: str, text: str, corpus_dir: Path = CORPUS_DIR):
+    """Save a live search page into the corpus"""
+    corpus_dir.mkdir(exist_ok=True)
+    with gzip.open(corpus_dir / f"{name}.html.gz", "wt", encoding="utf-8") as f:
+        f.write(text)
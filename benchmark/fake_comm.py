@@ -0,0 +1,20 @@
+import threading
+import time
+
+from huizenjacht.comm import Comm
+
+
+class FakeComm(Comm):
+    """Comm that only records what it was asked to send"""
+
+    def __init__(self):
+        self.sent: list[tuple[float, str, str, str]] = []  # (time, title, msg, url)
+        self.event = threading.Event()
+
+    def send(self, msg: str, title: str = None, url: str = None) -> int:
+        self.sent.append((time.perf_counter(), title, msg, url))
+        self.event.set()
+        return 0
+
+    def is_ready(self) -> bool:
+        return True
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmark.corpus import synthetic_page
+
+
+class StubState:
+    """Listings currently 'online' at the stub, newest first, and everything the stub received"""
+
+    def __init__(self, listings_per_page: int = 15):
+        self.listings_per_page = listings_per_page
+        self.newest = 10 ** 7
+        self.pages: dict[int, str] = {}  # Fixed pages to serve instead of synthetic ones
+        self.requests: list[str] = []
+        self.messages: list[tuple[float, dict]] = []  # (time, form data) received on the Pushover API
+        self.lock = threading.Lock()
+        self.message_event = threading.Event()
+
+    """Publish a number of new listings on top of the results"""
+    def publish(self, count: int):
+        with self.lock:
+            self.newest += count
+
+    def page(self, number: int) -> str:
+        if number in self.pages:
+            return self.pages[number]
+        start = self.newest - (number - 1) * self.listings_per_page
+        return synthetic_page(list(range(start, start - self.listings_per_page, -1)), filler_cards=100)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Stand-in for funda.nl search pages and the Pushover messages API"""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    state: StubState
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.state.requests.append(self.path)
+        if not url.path.startswith("/zoeken/"):
+            return self._reply(404, b"not found", "text/plain")
+
+        number = int(parse_qs(url.query).get("search_result", ["1"])[0])
+        body = self.state.page(number).encode()
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304, b"", "text/html", {"ETag": etag})
+        self._reply(200, body, "text/html; charset=utf-8", {"ETag": etag})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        if urlparse(self.path).path != "/1/messages.json":
+            return self._reply(404, b"{}", "application/json")
+
+        self.state.messages.append((time.perf_counter(), form))
+        self.state.message_event.set()
+        self._reply(200, json.dumps({"status": 1, "request": "stub"}).encode(), "application/json", {
+            "X-Limit-App-Limit": "10000",
+            "X-Limit-App-Remaining": str(10000 - len(self.state.messages)),
+            "X-Limit-App-Reset": str(int(time.time()) + 86400),
+        })
+
+    def _reply(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Date", formatdate(usegmt=True))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """Local HTTP server running in a background thread"""
+
+    def __init__(self, state: StubState = None):
+        self.state = state or StubState()
+        handler = type("Handler", (StubHandler,), {"state": self.state})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
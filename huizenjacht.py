@@ -5,28 +5,42 @@
 # MIT license
 
 import argparse
+import collections
 import logging
-import importlib
 import sqlite3
 import sys
 import traceback
+import queue
+import random
 import signal
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 try:  # Will fail if not on Linux
     import systemd.daemon
 except ImportError:
     pass  # Fail silently and log later
 
-import inflection
 import time
-import random
 
-from huizenjacht.source import Source, Funda
-from huizenjacht.comm import Comm
+from huizenjacht.source import SOURCES, Source
+from huizenjacht.cluster import Coordinator
+from huizenjacht.comm import COMMS, Comm, CommError, Dispatcher
 from huizenjacht.config import Config
+from huizenjacht.enrich import Enricher, format_record
+from huizenjacht.fetch import Archive, Fetcher, Recorder
+from huizenjacht.metrics import Metrics, MetricsServer
+from huizenjacht.profile import Profile
+from huizenjacht.scheduler import Scheduler
+from huizenjacht.store import AddressIndex, Compactor, ListingHistory, Outbox, attach_shared, connect
+from huizenjacht.utils.clock import Clock
 
 # Some constants
 PROGRAM_VERSION: str = "0.1"
 
+# Set by SIGHUP, the configuration is reloaded between two cycles
+reload_requested = threading.Event()
+
 def main():
     # Set up logging, include systemd Journal support
     logging.basicConfig()
@@ -56,13 +70,31 @@ def main():
     else:
         logger.setLevel(logging.INFO)
 
+    if args.replay is not None:
+        return replay(args.replay)
+
+    if args.changes_since is not None:
+        return print_changes(conf["server"]["db"], args.changes_since)
+
     if conf["server"]["simulate"]:
         logger.info("Server is in simulation mode, NO MESSAGES WILL BE SENT")
 
+    if args.record is not None:
+        logger.info(f"Recording all responses to {args.record}")
+        Fetcher().recorder = Recorder(args.record)
+
     # Load database
-    db = sqlite3.connect(conf["server"]["db"])
+    db = connect(conf["server"]["db"], cache_kib=conf["server"].get("db_cache_kib", 2048))
 
     hj = Huizenjacht(db)
+
+    # Expose metrics through a local endpoint and/or a stats file if configured
+    metrics_conf = conf["server"].get("metrics", {})
+    metrics_server = None
+    if metrics_conf.get("port") is not None:
+        metrics_server = MetricsServer(metrics_conf.get("address", "127.0.0.1"), metrics_conf["port"])
+    stats_file = metrics_conf.get("file")
+
     systemd_notify('READY=1')
 
     # Handle seeding of database
@@ -72,14 +104,38 @@ def main():
 
     min_waiting_time = conf["server"].get("poll_time_min", 240)  # seconds
     max_waiting_time = conf["server"].get("poll_time_max", 360)  # seconds
-    logger.info(f"Running Huizenjacht at an interval of {min_waiting_time}s to {max_waiting_time}s")
+    logger.info(f"Running Huizenjacht at a base interval of {min_waiting_time}s to {max_waiting_time}s")
 
     try:
         while True:
+            # Only tell the systemd watchdog we are alive while sources keep responding, so that a daemon that keeps
+            # failing is restarted
             hj.run()
-            time.sleep(random.randint(min_waiting_time, max_waiting_time))
+            if hj.healthy():
+                systemd_notify('WATCHDOG=1')
+            if stats_file is not None:
+                try:
+                    Metrics().write(stats_file)
+                except OSError as e:
+                    logger.warning(f"Could not write stats file: {e}")
+
+            # Sleep until the next source or heartbeat is due, or until a reload is requested
+            if reload_requested.wait(hj.time_until_due()):
+                reload_requested.clear()
+                systemd_notify(f'RELOADING=1\nMONOTONIC_USEC={time.monotonic_ns() // 1000}')
+                try:
+                    hj.reload()
+                except Exception as e:
+                    logger.error(f"Could not reload configuration, continuing with the current one: {e}")
+                else:
+                    conf = Config().config
+                    logger.setLevel(logging.DEBUG if args.verbose or conf['server']['debug'] else logging.INFO)
+                systemd_notify('READY=1')
     finally:
         systemd_notify('STOPPING=1')
+        hj.close()
+        if metrics_server is not None:
+            metrics_server.close()
 
         exc_type, exc_instance, _ = sys.exc_info()
         if not (exc_type, exc_instance) == (None, None):
@@ -89,18 +145,66 @@ def main():
 {exc_type.__name__}:
 {traceback.format_exc(limit=2)}"""
             title = conf["server"]["message_strings"]["server_info_msg_title"]
-            for c in hj.comms:
-                hj.send_msg(c, msg=msg, title=title)
+            hj.send_msg_all(msg=msg, title=title)
 
     return 0
 
-def reload(sig: int, frame):
-    systemd_notify(f'RELOADING=1\nMONOTONIC_USEC={time.monotonic_ns() // 1000}')
-
+def replay(path: str) -> int:
+    """
+    Run the daemon against the responses in a recording, on a simulated clock
+    Every cycle is answered from the recording as it was at that moment, and the clock jumps straight to the next
+    time a source is due, so a recording of days is replayed in seconds. No messages are sent, the database only
+    lives in memory and the enrichment cache is not used, so a replay never touches the state of the real daemon.
+    """
     logger = logging.getLogger()
-    logger.warning("Reload requested, but reloading is not supported yet")
+    conf = Config().config
+    conf["server"]["simulate"] = True
+    conf["server"]["enrichment"] = conf["server"].get("enrichment", {}) | {"cache_dir": None}
+    conf["server"]["cluster"] = None
+    random.seed(0)  # Makes the jitter of the scheduler, and therefore the replay, deterministic
+
+    archive = Archive(path)
+    if archive.start is None:
+        logger.error(f"Nothing to replay, {path} contains no responses")
+        return 1
+
+    clock = Clock()
+    clock.simulate(archive.start)
+    Fetcher().archive = archive
+    logger.info(f"Replaying {len(archive)} responses spanning {(archive.end - archive.start) / 3600:.1f} hours")
+
+    start = time.perf_counter()
+    hj = Huizenjacht(connect(":memory:"), background=False)
+    cycles = 0
+    try:
+        while True:
+            hj.run()
+            hj.drain()
+            cycles += 1
+            if clock.time() >= archive.end:
+                break  # The last cycle has seen the last recorded responses
+            clock.advance(max(hj.time_until_due(), 1))
+    finally:
+        hj.close()
+    elapsed = time.perf_counter() - start
 
-    systemd_notify('READY=1')
+    metrics = Metrics()
+    print(f"Replayed {cycles} cycles in {elapsed:.2f}s ({cycles / elapsed:.0f} cycles/s): "
+          f"{metrics.total('new_houses_total'):.0f} new houses, "
+          f"{metrics.total('notifications_sent_total'):.0f} notifications")
+    return 0
+
+def print_changes(db_file: str, hours: float) -> int:
+    """Print the listing history of the last hours"""
+    history = ListingHistory(connect(db_file))
+    for t, source_name, _, event, url in history.changes_since(Clock().time() - hours * 3600):
+        print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(t))}  {source_name:<12} {event:<9} {url or ''}")
+    return 0
+
+def reload(sig: int, frame):
+    logger = logging.getLogger()
+    logger.info("Reload requested, applying configuration after the current cycle")
+    reload_requested.set()
 
 def systemd_notify(message: str):
     try:
@@ -113,6 +217,9 @@ class Huizenjacht:
     # Class constants
     SOURCES_KEY = "sources"
     COMMS_KEY = "comm"
+    PROFILES_KEY = "profiles"
+    RESTART_KEYS = ("db", "db_cache_kib", "store_urls", "seen_index", "poll_workers", "outbox", "metrics",
+                    "enrichment", "retention", "fetch", "history", "duplicates", "cluster")
 
     SERVER_COMM_MSG_TITLE: str
     STARTUP_COMM_MSG_TEXT: str
@@ -128,134 +235,488 @@ class Huizenjacht:
 
     sources: list[Source]
     comms: list[Comm]
+    profiles: list[Profile]
+    scheduler: Scheduler
 
     # Private attributes
     _conn: sqlite3.Connection
-
-    def __init__(self, db: sqlite3.Connection):
+    _loaded_sources: dict[str, Source]  # Active sources by config key
+    _loaded_comms: dict[str, Comm]  # Active comms by config key
+    _loaded_profiles: dict[str, Profile]  # Active profiles by config key
+    _executor: ThreadPoolExecutor
+    _in_flight: dict[Source, Future]  # Fetches that have not finished yet, possibly from an earlier cycle
+    _source_timeout: float
+    _watchdog_after: float  # Seconds without a responding source after which the daemon is no longer healthy
+    _outbox: Outbox
+    _dispatcher: Dispatcher
+    _enricher: Enricher
+    _compactor: Compactor | None
+    _history: ListingHistory | None
+    _addresses: AddressIndex | None
+    _cluster: Coordinator | None
+    _last_compaction: float  # Time of the last compaction done by drain()
+    _last_success: float  # Time of the last cycle in which a source responded
+
+    """Set up the daemon on database db
+    If background is False, no notification or compaction threads are started, and drain() must be called after
+    every cycle instead."""
+    def __init__(self, db: sqlite3.Connection, background: bool = True):
         self.logger = logging.getLogger(type(self).__name__)
         self.conf = Config().config
         self._conn = db
         self.db = db.cursor()
 
+        # In a cluster, houses are claimed in the database that all nodes share, which has to be attached before the
+        # sources create their seen-tables. Every connection to the local database then uses the same rollback journal.
+        self._cluster = Coordinator([])
+        journal_mode = "WAL"
+        if self._cluster.active:
+            journal_mode = self._cluster.conf["journal_mode"]
+            attach_shared(db, self._cluster.conf["db"], journal_mode)
+        else:
+            self._cluster = None
+
         # Load active sources and active comms
-        self.sources = self.load_sources(
-            [key for key in self.conf[self.SOURCES_KEY].keys()
-                if self.conf[self.SOURCES_KEY][key]["active"]],
-            db
-        )
-        self.comms = self.load_comms(
-            [key for key in self.conf[self.COMMS_KEY].keys()
-                if self.conf[self.COMMS_KEY][key]["active"]]
+        self._loaded_sources = self._load_section(self.SOURCES_KEY, {}, None, lambda keys: self.load_sources(keys, db))
+        self._loaded_comms = self._load_section(self.COMMS_KEY, {}, None, self.load_comms)
+        self.sources = list(self._loaded_sources.values())
+        self.comms = list(self._loaded_comms.values())
+
+        # In multi-profile mode, houses are also fanned out to the comms of every profile they match
+        self._loaded_profiles = self._load_section(self.PROFILES_KEY, {}, None, self.load_profiles)
+        self.profiles = list(self._loaded_profiles.values())
+
+        self._read_server_conf()
+
+        # Set up the polling engine, sources are fetched concurrently
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.conf["server"].get("poll_workers", max(len(self.sources), 1)),
+            thread_name_prefix="poll",
         )
+        self._in_flight = {}
+        if self._cluster is not None:
+            self._cluster.update_names([s.name for s in self.sources])
+            self._cluster.heartbeat()
+        self.scheduler = Scheduler(self._leased_sources())
+
+        # Notifications go through the outbox and are delivered by a background dispatcher, which uses its own
+        # connection unless the database only lives in memory
+        self._outbox = Outbox(db)
+        db_file = db.execute("PRAGMA database_list").fetchone()[2]
+        dispatcher_outbox = Outbox(connect(db_file, journal_mode=journal_mode)) if db_file else self._outbox
+        self._dispatcher = Dispatcher(dispatcher_outbox, self._outbox_comms(), self.send_msg)
+        if background:
+            self._dispatcher.start()
+
+        # Houses that have disappeared are forgotten in the background, only for databases that live in a file
+        self._compactor = None
+        self._last_compaction = Clock().time()
+        if not background:
+            self._compactor = Compactor(db)
+        elif db_file:
+            compactor_db = connect(db_file, journal_mode=journal_mode)
+            if self._cluster is not None:
+                attach_shared(compactor_db, self._cluster.conf["db"], journal_mode)
+            self._compactor = Compactor(compactor_db)
+            self._compactor.start()
+
+        # Every listing that is seen is compared against its last fingerprint, to record price and status changes
+        self._history = ListingHistory(db)
+        if not self._history.active:
+            self._history = None
+
+        # A house that is listed on several sources is only notified for the source it was found on first
+        self._addresses = AddressIndex(db)
+        if not self._addresses.active:
+            self._addresses = None
+
+        # Detail pages of new houses are fetched before their notification is queued
+        self._enricher = Enricher()
+        if self.profiles and not self._enricher.active:
+            self.logger.warning("Profiles can only filter on price, rooms and size when enrichment is active")
+
+        self._last_success = Clock().time()
+        metrics = Metrics()
+        metrics.set("last_success_age_seconds", lambda: Clock().time() - self._last_success)
+        metrics.set("outbox_size", lambda: len(self._outbox))
 
+        # Send a startup message
+        self.send_msg_all(msg=self.STARTUP_COMM_MSG_TEXT, title=self.SERVER_COMM_MSG_TITLE)
+
+    """Reload the configuration file and apply it
+    Only sources and comms whose configuration section changed are rebuilt, the database connection, HTTP pools,
+    caches and the state of everything else are kept. Must be called between cycles. Server settings that are only
+    read at startup are reported, they take effect after a restart."""
+    def reload(self):
+        old_conf = self.conf
+        self.conf = Config().reload()
+
+        # The server settings are checked before anything is rebuilt, a configuration without them is rejected as a
+        # whole and the current one stays in effect
+        try:
+            self._read_server_conf()
+            self.scheduler.update_conf()
+        except Exception:
+            self.conf = old_conf
+            Config().restore(old_conf)
+            self._read_server_conf()
+            self.scheduler.update_conf()
+            raise
+        Metrics().inc("reloads_total")
+
+        self._loaded_sources = self._load_section(self.SOURCES_KEY, self._loaded_sources, old_conf[self.SOURCES_KEY],
+                                                  lambda keys: self.load_sources(keys, self._conn))
+        self._loaded_comms = self._load_section(self.COMMS_KEY, self._loaded_comms, old_conf[self.COMMS_KEY],
+                                                self.load_comms)
+        self.sources = list(self._loaded_sources.values())
+        self.comms = list(self._loaded_comms.values())
+
+        # Profile comms inherit from the top-level comm entries, so all profiles are rebuilt when those change
+        old_profiles = old_conf.get(self.PROFILES_KEY) or {}
+        if old_conf.get(self.COMMS_KEY) != self.conf.get(self.COMMS_KEY):
+            old_profiles = {}
+        self._loaded_profiles = self._load_section(self.PROFILES_KEY, self._loaded_profiles, old_profiles,
+                                                   self.load_profiles)
+        self.profiles = list(self._loaded_profiles.values())
+
+        if self._cluster is not None:
+            self._cluster.update_names([s.name for s in self.sources])
+        self.scheduler.update_sources(self._leased_sources())
+        self._dispatcher.update_comms(self._outbox_comms())
+
+        restart_keys = [key for key in self.RESTART_KEYS
+                        if old_conf["server"].get(key) != self.conf["server"].get(key)]
+        if restart_keys:
+            self.logger.warning(f"Changes to server settings {', '.join(restart_keys)} take effect after a restart")
+
+        self.logger.info(f"Configuration reloaded, sources: {', '.join(self._loaded_sources) or 'none'}, "
+                         f"comms: {', '.join(self._loaded_comms) or 'none'}, "
+                         f"profiles: {', '.join(self._loaded_profiles) or 'none'}")
+
+    """Return instances for all active entries of a config section
+    Instances in loaded whose entry is unchanged from old_section are reused. When an entry fails to load on reload,
+    the running instance is kept."""
+    def _load_section(self, section_key: str, loaded: dict, old_section: dict | None, load: Callable) -> dict:
+        instances = {}
+        for key, entry in (self.conf.get(section_key) or {}).items():
+            if not entry.get("active"):
+                continue
+            if key in loaded and old_section is not None and old_section.get(key) == entry:
+                instances[key] = loaded[key]
+                continue
+
+            try:
+                instances[key] = load([key])[0]
+            except Exception as e:
+                if old_section is None:
+                    raise
+                self.logger.error(f"Could not load {key} with the new configuration: {e}")
+                if key in loaded:
+                    instances[key] = loaded[key]
+                continue
+            self.logger.info(f"{'Reloaded' if key in loaded else 'Loaded'} {key}")
+
+        return instances
+
+    """All comms that notifications can be queued for, by outbox name"""
+    def _outbox_comms(self) -> dict[str, Comm]:
+        comms = {type(c).__name__: c for c in self.comms}
+        for profile in self.profiles:
+            comms |= profile.comms
+        return comms
+
+    def _read_server_conf(self):
         # Read config values
         self.SERVER_COMM_MSG_TITLE = self.conf["server"]["message_strings"]["server_info_msg_title"]
         self.STARTUP_COMM_MSG_TEXT = self.conf["server"]["message_strings"]["server_startup_msg_text"]
         self.AND = self.conf["server"]["message_strings"]["and"]
         self.DEFAULT_MSG_TITLE = self.conf["server"]["message_strings"]["default_title"]
         self.DEFAULT_MSG_TITLE_PLURAL = self.conf["server"]["message_strings"]["default_title_plural"]
+        self._source_timeout = self.conf["server"].get("source_timeout", 60)  # seconds
+        self._watchdog_after = self.conf["server"].get("watchdog_after", 7200)  # seconds
 
-        # Send a startup message
-        for comm in self.comms:
-            self.send_msg(comm, msg=self.STARTUP_COMM_MSG_TEXT, title=self.SERVER_COMM_MSG_TITLE)
-
-    def run(self):
-        """Go once through all sources and push new houses to all comms"""
+    def run(self) -> bool:
+        """Go once through all sources that are due and push new houses to all comms
+        Returns whether the cycle succeeded, meaning that at least one source responded or none was due."""
         self.logger.debug("Running Huizenjacht")
-
-        # Get new houses
-        new_houses = {}
-        for source in self.sources:
-            for house in source.get():
-                if source.is_new(house):
-                    key = type(source).__name__
-                    if key in new_houses:
-                        new_houses[key].append(house)
-                    else:
-                        new_houses[key] = [house]
-
-        # Return if no new houses
-        if len(new_houses) == 0:
+        metrics = Metrics()
+        start = time.perf_counter()
+
+        recorder = Fetcher().recorder
+        if recorder is not None:
+            recorder.mark_cycle(Clock().time())
+
+        if self._cluster is not None and self._cluster.time_until_heartbeat() == 0:
+            self._cluster.heartbeat()
+            self.scheduler.update_sources(self._leased_sources())
+
+        # Handle every batch of houses as soon as it arrives, so the first new house is pushed before the remaining
+        # pages and sources have been fetched
+        new_counts: dict[Source, int] = {}
+        sources = self.scheduler.due()
+        responded = 0
+        for source, houses, done in self.poll(sources):
+            if houses is None:  # Failed or timed out
+                self.scheduler.record(source, new_counts.get(source, 0), None)
+                continue
+
+            if len(houses) > 0:
+                new = self.handle_houses(source, houses)
+                new_counts[source] = new_counts.get(source, 0) + len(new)
+                metrics.inc("new_houses_total", len(new), source=source.name)
+                if len(new) > 0:
+                    self._dispatcher.wake()
+
+            if done:
+                if source.last_status is not None:
+                    responded += 1
+                self.scheduler.record(source, new_counts.get(source, 0), source.last_status)
+
+        if self._history is not None:
+            self.record_history()
+
+        success = responded > 0 or len(sources) == 0
+        metrics.observe("cycle_seconds", time.perf_counter() - start)
+        metrics.inc("cycles_total", outcome="success" if success else "failure")
+        if success and len(sources) > 0:
+            self._last_success = Clock().time()
+
+        new_counts = {s.name: n for s, n in new_counts.items() if n > 0}
+        if len(new_counts) == 0:
             self.logger.debug("No new houses found")
+        else:
+            self.logger.info(f"Found {sum(new_counts.values())} new houses on {', '.join(new_counts.keys())}")
+        return success
+
+    """
+    Whether a source responded within the last watchdog_after seconds
+    Cycles in which no source was due do not count, a cluster node wakes up for every heartbeat even if all its polls
+    fail. A node without sources to poll, e.g. in a cluster with more nodes than sources, is always healthy.
+    """
+    def healthy(self) -> bool:
+        if len(self._leased_sources()) == 0:
+            return True
+        return Clock().time() - self._last_success < self._watchdog_after
+
+    """Return the number of seconds until the next source is due, or until the next heartbeat in a cluster"""
+    def time_until_due(self) -> float:
+        wait = self.scheduler.time_until_due()
+        if self._cluster is not None:
+            wait = min(wait, self._cluster.time_until_heartbeat())
+        return wait
+
+    """The sources this node polls: all of them, or in a cluster the ones it holds a lease on"""
+    def _leased_sources(self) -> list[Source]:
+        if self._cluster is None:
+            return self.sources
+        return [s for s in self.sources if self._cluster.holds(s.name)]
+
+    """Enrich, deduplicate and queue notifications for a batch of houses from source, returns the new ones"""
+    def handle_houses(self, source: Source, houses: list) -> list:
+        # Enrich the houses that look new before deduplicating, so that no write transaction is held open while
+        # detail pages are being fetched
+        records = {}
+        if self._enricher.active:
+            records = self._enricher.enrich(source, [h for h in houses if not source.is_seen(h)])
+
+        if self._history is not None:
+            self._history.observe(source.name, houses, source.fingerprint)
+
+        # Houses are marked as seen in the same transaction that queues their notification
+        new = source.filter_new(houses, commit=False)
+        if len(new) > 0 and self._addresses is not None:
+            new = self.filter_duplicates(source, new, records)
+        if len(new) > 0:
+            self.enqueue_houses(source.name, new, records)
+            for profile in self.profiles:
+                matched = profile.filter_new(source, new, records, commit=False)
+                self.enqueue_houses(source.name, matched, records, list(profile.comms))
+        self._conn.commit()
+        return new
+
+    """Drop the houses that were found on another source before, in the open transaction, returns the rest
+    Addresses from the detail page take precedence over what the source knows from the listing itself."""
+    def filter_duplicates(self, source: Source, houses: list, records: dict[str, dict]) -> list:
+        addresses = {}
+        for house in houses:
+            street, city, postcode = source.address(house) or (None, None, None)
+            record = records.get(house) or {}
+            addresses[house] = (record.get("street") or street, record.get("city") or city,
+                                record.get("postcode") or postcode)
+
+        first, duplicates = self._addresses.filter_first(source.name, houses, addresses)
+        for house, (original_source, original_url) in duplicates.items():
+            self.logger.info(f"Not notifying {house}, it is the same house as {original_url} on {original_source}")
+        Metrics().inc("duplicate_houses_total", len(duplicates), source=source.name)
+        return first
+
+    """Write the listings seen in this cycle to the history and report what changed"""
+    def record_history(self):
+        with Metrics().timer("history_seconds"):
+            events = self._history.flush()
+
+        counts = {}
+        for _, source_name, url, event in events:
+            counts[event] = counts.get(event, 0) + 1
+            Metrics().inc("listing_events_total", source=source_name, event=event)
+            if event in ("changed", "relisted"):
+                self.logger.info(f"Listing {event} on {source_name}: {url}")
+        if counts:
+            self.logger.debug(f"Listing history: {', '.join(f'{n} {event}' for event, n in counts.items())}")
+
+    """Queue a notification for every new house for the given comms, by default all top-level comms, without
+    committing. Comms merge notifications that are due at the same time into a single message."""
+    def enqueue_houses(self, source_name: str, houses: list, records: dict[str, dict] = None,
+                       comm_names: list[str] = None):
+        if comm_names is None:
+            comm_names = [type(c).__name__ for c in self.comms]
+        if not comm_names:
             return
-
-        # Parse some information
-        new_houses_count = sum([len(h) for h in new_houses])
-        new_houses_sources = new_houses.keys()
-        new_houses_sources = ', '.join(new_houses_sources)
-        self.logger.info(f"Found {new_houses_count} new houses on {new_houses_sources}")
-
-        # Create message strings
-        if new_houses_count == 1:  # use singular if only one house available
-            title = self.DEFAULT_MSG_TITLE
-            msg = f"Er is 1 nieuw huis gevonden op {new_houses_sources}"
-        else:  # else use plural
-            title = self.DEFAULT_MSG_TITLE_PLURAL
-            msg = f"Er zijn {new_houses_count} nieuwe huizen gevonden op {new_houses_sources}"
-
-        try:  # Funda has high priority
-            url = new_houses[type(Funda).__name__][0]
-        except KeyError:  # If no funda house, just get the first one available
-            url = next(iter(new_houses.values()))[0]
-
-        # Send message to all active comms
-        for c in self.comms:
-            self.send_msg(c, msg, title, url)
-
-    """Load all source objects into a list and return that list"""
+        records = records or {}
+        for house in houses:
+            msg = f"Er is 1 nieuw huis gevonden op {source_name}"
+            if house in records:
+                msg += "\n" + format_record(records[house])
+            self._outbox.enqueue(comm_names, msg, self.DEFAULT_MSG_TITLE, house, commit=False)
+
+    """Fetch all given sources concurrently, streaming their results
+    Yields (source, houses, done) tuples in order of arrival. Every batch of houses a source produces, typically a
+    result page, is yielded right away with done False. A source ends with done True, and houses set to [] when it
+    finished, or to None if it failed or missed its deadline. Every source gets its own deadline, configured by its
+    'deadline' entry or the server-wide 'source_timeout', its 'timeout' entry only limits a single request. Only the
+    fetch counts towards the deadline, a source that finished in time is never given up on because the caller took long
+    to handle earlier batches. Sources that miss their deadline are skipped for this cycle, and are not resubmitted
+    until their previous fetch has finished."""
+    def poll(self, sources: list[Source]):
+        results = queue.Queue()
+        deadlines: dict[Source, float] = {}
+        now = time.monotonic()
+        for source in sources:
+            if source in self._in_flight:
+                self.logger.warning(f"Previous fetch of {source.name} still running, skipping this cycle")
+                yield source, None, True
+                continue
+
+            future = self._executor.submit(self._stream, source, results)
+            self._in_flight[source] = future
+            future.add_done_callback(lambda _, s=source: self._in_flight.pop(s, None))
+            deadlines[source] = now + source.conf_value("deadline", self._source_timeout)
+
+        pending = collections.deque()
+        while deadlines:
+            if not pending:
+                try:
+                    pending.append(results.get(timeout=max(min(deadlines.values()) - time.monotonic(), 0)))
+                except queue.Empty:
+                    pass
+
+            # Everything that arrived while the caller was handling the previous batch arrived in time, so the queue
+            # is drained before any deadline is checked
+            while True:
+                try:
+                    pending.append(results.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Give up on sources whose deadline has passed and that have not finished
+            finished = {source for source, item in pending if not isinstance(item, list)}
+            now = time.monotonic()
+            for source in [s for s, deadline in deadlines.items() if deadline <= now and s not in finished]:
+                self.logger.warning(f"{source.name} did not respond within its deadline")
+                del deadlines[source]
+                yield source, None, True
+
+            if not pending:
+                continue
+            source, item = pending.popleft()
+            if source in deadlines:  # Anything else is a late result of a source that missed its deadline
+                if item is None:
+                    del deadlines[source]
+                    yield source, [], True
+                elif isinstance(item, Exception):
+                    self.logger.error(f"Fetching {source.name} failed", exc_info=item)
+                    del deadlines[source]
+                    yield source, None, True
+                else:
+                    yield source, item, False
+
+    """Run a source in a worker thread, putting every batch, and then None or the exception it raised, on results"""
+    @staticmethod
+    def _stream(source: Source, results: queue.Queue):
+        try:
+            for houses in source.stream():
+                if houses:
+                    results.put((source, houses))
+        except Exception as e:
+            results.put((source, e))
+            return
+        results.put((source, None))
+
+    """Do the work of the background threads in the calling thread, for a daemon that was set up without them"""
+    def drain(self):
+        self._dispatcher.drain()
+        now = Clock().time()
+        if now - self._last_compaction >= self._compactor.conf["interval"]:
+            self._compactor.compact(now)
+            self._last_compaction = now
+
+    """Stop the polling engine and dispatcher without waiting for running fetches"""
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._enricher.close()
+        if self._compactor is not None:
+            self._compactor.stop(timeout=5)
+        self._dispatcher.stop(timeout=self._dispatcher.conf["send_timeout"])
+        if self._cluster is not None:
+            self._cluster.close()
+        Fetcher().close()
+
+    """Load all source objects into a list and return that list
+    An entry with a type is an instance of that source type under the name of the entry, e.g. a generic source."""
     def load_sources(self, sources: list, db: sqlite3.Connection) -> list[Source]:
-        return self._load_classes_from_module(db, module_list=sources, module_location="huizenjacht.source")
+        loaded = []
+        for name in sources:
+            source_type = self.conf[self.SOURCES_KEY][name].get("type") or name
+            loaded.append(SOURCES.get(source_type)(db, name))
+        return loaded
 
     """Load all comm objects into a list and return that list"""
     def load_comms(self, comms: list) -> list[Comm]:
-        return self._load_classes_from_module(module_list=comms, module_location="huizenjacht.comm")
-
-    def _load_classes_from_module(self, *args, module_list: list, module_location: str):
-        # Collect file names and object names of modules
-        file_names, object_names = self._str_to_file_and_object_names(module_list)
-
-        # Iterate through module strings and attempt to load corresponding objects
-        # The class name must be CamelCased, the filename must be snake_cased
-        objects = []
-        for module_file, object_name in zip(file_names, object_names):
-            objects.append(
-                getattr(
-                    importlib.import_module(f".{module_file}", module_location),  # Module
-                    object_name
-                )(*args)
-            )
-
-        return objects
+        return [COMMS.get(name)() for name in comms]
 
-    """From a list of strings, generate a list of filenames and object names for Sources and Comms """
-    def _str_to_file_and_object_names(self, stringlist: list[str]) -> (list[str], list[str]):
-        # Make a copy of input with all inputs cast to a string and anything not alphanumeric or underscore removed
-        _stringlist = [''.join(c for c in str(s) if c.isalnum() or c == '_') for s in stringlist]
-
-        # Convert to snake_case
-        file_names: list[str] = [inflection.underscore(s) for s in _stringlist]
-
-        # Convert to CamelCase
-        object_names: list[str] = [inflection.camelize(s, uppercase_first_letter=True) for s in _stringlist]
-
-        return file_names, object_names
+    """Load all profiles into a list and return that list"""
+    def load_profiles(self, profiles: list) -> list[Profile]:
+        return [Profile(name, self._conn) for name in profiles]
 
     def seed(self):
-        for source in self.sources:
-            houses = source.get()
-            for h in houses:
-                source.is_new(h)
+        for source, houses, _ in self.poll(self.sources):
+            if houses:
+                if self._history is not None:
+                    self._history.observe(source.name, houses, source.fingerprint)
+                source.filter_new(houses)
+                for profile in self.profiles:
+                    profile.seed(source, houses)
+        if self._history is not None:
+            self._history.flush()
 
     """Send a message to specified comm object"""
     def send_msg(self, comm: Comm, msg: str, title: str = None, url: str = None) -> int:
         if not self.conf["server"]["simulate"]:
             self.logger.debug(f"msg to {type(comm).__name__}: t'{title}' m'{msg}' u'{url}'")
-            return comm.send(msg=msg, title=title, url=url)
+            with Metrics().timer("send_seconds", comm=type(comm).__name__):
+                return comm.send(msg=msg, title=title, url=url)
         else:
             self.logger.info(f"sim-msg to {type(comm).__name__}: t'{title}' m'{msg}' u'{url}'")
             return 0
 
+    """Send a message to all active comms right away, bypassing the outbox"""
+    def send_msg_all(self, msg: str, title: str = None, url: str = None):
+        for comm in self.comms:
+            try:
+                self.send_msg(comm, msg, title, url)
+            except (CommError, OSError) as e:
+                self.logger.warning(f"Could not send message to {type(comm).__name__}: {e}")
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
@@ -267,6 +728,10 @@ def parse_arguments():
     parser.add_argument("-v", "--verbose", action="store_true", help="Log debug information")
     parser.add_argument("--version", action="version", version=f"%(prog)s v{PROGRAM_VERSION}")
     parser.add_argument("--reseed", action="store_true", help="Pull all currently available houses into database without notifying user")
+    parser.add_argument("--changes-since", type=float, metavar="HOURS", help="Print the listings that were added, changed or delisted in the last HOURS and exit")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", type=str, metavar="FILE", help="Append every response that is received to FILE")
+    mode.add_argument("--replay", type=str, metavar="FILE", help="Replay the responses recorded in FILE on a simulated clock and exit")
     return parser.parse_args()
 
 
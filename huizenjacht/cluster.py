@@ -0,0 +1,196 @@
+import logging
+import math
+import os
+import socket
+import sqlite3
+
+from huizenjacht.config import Config
+from huizenjacht.metrics import Metrics
+from huizenjacht.store import connect
+from huizenjacht.utils.clock import Clock
+
+
+class Coordinator:
+    """
+    Splits the sources between the nodes of a cluster with time-limited leases in a shared database.
+    Every heartbeat, a node renews the leases it holds and takes leases that are free or have expired, until it holds
+    its fair share: the number of sources divided by the number of live nodes, rounded up. A node that holds more than
+    its share, because another node joined, gives up the surplus. A node that stops heartbeating loses its leases
+    after lease_time seconds, and the other nodes take over its sources at their next heartbeat.
+    A heartbeat is a single short transaction, so the shared database only sees a few writes per node per minute.
+    Leases only decide which node polls a source. After a takeover, two nodes may poll the same source once, which is
+    harmless because new houses are claimed atomically in the shared seen-tables.
+    """
+
+    # Constants
+    FORGET_AFTER = 10  # lease times after which a node that stopped heartbeating is removed
+
+    _db_table_create_stmts = (
+        '''
+CREATE TABLE IF NOT EXISTS "Nodes" (
+	"node"	TEXT NOT NULL,
+	"heartbeat"	REAL NOT NULL,
+	PRIMARY KEY("node")
+) WITHOUT ROWID''',
+        '''
+CREATE TABLE IF NOT EXISTS "Leases" (
+	"name"	TEXT NOT NULL,
+	"owner"	TEXT NOT NULL,
+	"expires"	REAL NOT NULL,
+	PRIMARY KEY("name")
+) WITHOUT ROWID''',
+    )
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+    node: str
+    db: sqlite3.Cursor | None
+
+    # Private attributes
+    _conn: sqlite3.Connection | None
+    _names: list[str]  # Names of the sources to split
+    _held: set[str]  # Names of the sources this node holds a lease on
+    _held_until: float  # Time the leases expire unless they are renewed
+    _live_nodes: int
+    _next_heartbeat: float
+
+    def __init__(self, names: list[str]):
+        self.logger = logging.getLogger(__name__)
+        self.conf = {
+            "db": None,  # file of the shared database, there is no cluster without one
+            "node": f"{socket.gethostname()}-{os.getpid()}",  # unique name of this node
+            "lease_time": 120,  # seconds a lease lasts without being renewed
+            "heartbeat": 30,  # seconds between two heartbeats, well below lease_time
+            "journal_mode": "DELETE",  # a rollback journal, so claims commit atomically with the local outbox
+        } | (Config().config["server"].get("cluster") or {})
+        self.node = self.conf["node"]
+
+        self._names = list(names)
+        self._held = set()
+        self._held_until = 0
+        self._live_nodes = 0
+        self._next_heartbeat = 0
+
+        self._conn = None
+        self.db = None
+        if not self.active:
+            return
+
+        self._conn = connect(self.conf["db"], journal_mode=self.conf["journal_mode"])
+        self.db = self._conn.cursor()
+        for stmt in self._db_table_create_stmts:
+            self.db.execute(stmt)
+        self._conn.commit()
+
+        metrics = Metrics()
+        metrics.set("leases_held", lambda: len(self._held))
+        metrics.set("cluster_nodes", lambda: self._live_nodes)
+
+    @property
+    def active(self) -> bool:
+        return self.conf["db"] is not None
+
+    """Track a new set of source names, leases on names that are gone are given up at the next heartbeat"""
+    def update_names(self, names: list[str]):
+        self._names = list(names)
+        self._next_heartbeat = 0
+
+    """Whether this node holds the lease on the named source"""
+    def holds(self, name: str, now: float = None) -> bool:
+        now = Clock().time() if now is None else now
+        return name in self._held and now < self._held_until
+
+    """Return the number of seconds until the next heartbeat is due"""
+    def time_until_heartbeat(self, now: float = None) -> float:
+        now = Clock().time() if now is None else now
+        return max(self._next_heartbeat - now, 0)
+
+    """
+    Renew, take and give up leases so that this node holds its share of the sources
+    Returns the names of the sources this node holds afterwards. If the shared database cannot be reached, the leases
+    are kept until they expire.
+    """
+    def heartbeat(self, now: float = None) -> set[str]:
+        now = Clock().time() if now is None else now
+        self._next_heartbeat = now + self.conf["heartbeat"]
+        try:
+            held, released, taken_over = self._heartbeat(now)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Heartbeat failed, {len(self._held)} leases are kept until they expire: {e}")
+            return self._held
+
+        lost = self._held - held - released
+        if lost:
+            self.logger.warning(f"Lost the lease on {', '.join(sorted(lost))} to another node")
+        if released:
+            self.logger.info(f"Gave up the lease on {', '.join(sorted(released))} to balance the cluster")
+        gained = held - self._held - taken_over
+        if gained:
+            self.logger.info(f"Took the lease on {', '.join(sorted(gained))}")
+        if taken_over:
+            self.logger.info(f"Took over {', '.join(sorted(taken_over))} from a node that stopped heartbeating")
+            Metrics().inc("lease_takeovers_total", len(taken_over))
+
+        self._held = held
+        self._held_until = now + self.conf["lease_time"]
+        return held
+
+    """Run a heartbeat in a single transaction, returns the names held, given up and taken over from another node"""
+    def _heartbeat(self, now: float) -> tuple[set[str], set[str], set[str]]:
+        lease_time = self.conf["lease_time"]
+        expires = now + lease_time
+
+        self.db.execute("BEGIN IMMEDIATE")  # Nodes see each other's leases in the order they heartbeat
+        try:
+            self.db.execute(
+                'INSERT INTO "Nodes" (node, heartbeat) VALUES (?, ?) '
+                'ON CONFLICT(node) DO UPDATE SET heartbeat = excluded.heartbeat',
+                [self.node, now]
+            )
+            self.db.execute('DELETE FROM "Nodes" WHERE heartbeat < ?', [now - self.FORGET_AFTER * lease_time])
+            self._live_nodes = self.db.execute(
+                'SELECT COUNT(*) FROM "Nodes" WHERE heartbeat >= ?', [now - lease_time]
+            ).fetchone()[0]
+            share = math.ceil(len(self._names) / max(self._live_nodes, 1))
+
+            # A lease of this node that expired is still renewed, as long as no other node has taken it over
+            leases = {name: (owner, until) for name, owner, until
+                      in self.db.execute('SELECT name, owner, expires FROM "Leases"')}
+            held = [name for name in self._names if leases.get(name, (None, 0))[0] == self.node]
+            surplus = [name for name, (owner, _) in leases.items() if owner == self.node and name not in held]
+            surplus += held[share:]
+            held = held[:share]
+
+            free = [name for name in self._names
+                    if name not in held and name not in surplus and (name not in leases or leases[name][1] < now)]
+            taken = free[:share - len(held)]
+            held += taken
+
+            self.db.executemany(
+                'INSERT INTO "Leases" (name, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires',
+                [(name, self.node, expires) for name in held]
+            )
+            self.db.executemany('DELETE FROM "Leases" WHERE name = ? AND owner = ?',
+                                [(name, self.node) for name in surplus])
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+        taken_over = {name for name in taken if name in leases}
+        return set(held), set(surplus), taken_over
+
+    """Give up all leases, so that the other nodes take over right away, and leave the cluster"""
+    def close(self):
+        if self._conn is None:
+            return
+        try:
+            self.db.execute('DELETE FROM "Leases" WHERE owner = ?', [self.node])
+            self.db.execute('DELETE FROM "Nodes" WHERE node = ?', [self.node])
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Could not give up leases, other nodes take over when they expire: {e}")
+        self._held = set()
+        self._conn.close()
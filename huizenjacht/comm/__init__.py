@@ -1,7 +1,20 @@
 __all__ = [
+    "COMMS",
     "Comm",
+    "CommError",
+    "Dispatcher",
     "Pushover",
 ]
 
-from .comm_intf import Comm
-from .pushover import Pushover
+from huizenjacht.utils.registry import Registry
+from .comm_intf import Comm, CommError
+from .dispatcher import Dispatcher
+
+# Available comms by config key, a comm module is imported once the comm is used
+COMMS = Registry(__name__, {
+    "pushover": ".pushover:Pushover",
+})
+
+
+def __getattr__(name: str):
+    return COMMS.get_by_class_name(name)
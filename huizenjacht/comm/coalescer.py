@@ -0,0 +1,58 @@
+from huizenjacht.config import Config
+
+
+class Coalescer:
+    """
+    Merges queued notifications for a single comm into digests.
+    The first notification after a quiet spell is let through right away. Notifications that follow within the
+    window are held back until the window has passed or max_count of them are waiting, and then sent as one digest
+    that lists all urls. With a window of 0, all notifications that are due at the same time are merged.
+    """
+
+    # Public attributes
+    window: float  # seconds
+    max_count: int
+    max_length: int  # characters, digests are kept shorter than this
+
+    # Private attributes
+    _last_sent: float
+    _plural_title: str
+
+    def __init__(self, window: float = 0, max_count: int = 100, max_length: int = 1024):
+        self.window = window
+        self.max_count = max_count
+        self.max_length = max_length
+
+        self._last_sent = 0
+        self._plural_title = Config().config["server"]["message_strings"]["default_title_plural"]
+
+    """Check whether the given notifications should be sent now"""
+    def ready(self, count: int, now: float) -> bool:
+        return count > 0 and (count >= self.max_count or now - self._last_sent >= self.window)
+
+    """Register that a digest has been sent"""
+    def sent(self, now: float):
+        self._last_sent = now
+
+    """
+    Merge notifications into a single message
+    Takes a list of (title, msg, url) tuples and returns a single (title, msg, url) tuple.
+    """
+    def merge(self, notifications: list[tuple[str, str, str]]) -> tuple[str, str, str]:
+        if len(notifications) == 1:
+            return notifications[0]
+
+        urls = [url for _, _, url in notifications if url is not None]
+        msg = f"Er zijn {len(notifications)} nieuwe huizen gevonden:"
+
+        # Add as many urls as fit, leaving room for a line mentioning the rest. Comms truncate messages of max_length
+        # characters or more, so the digest stays below it
+        budget = self.max_length - 1
+        for i, url in enumerate(urls):
+            rest = f"\n... en {len(urls) - i} meer"
+            if len(msg) + 1 + len(url) + (len(rest) if i < len(urls) - 1 else 0) > budget:
+                msg += rest
+                break
+            msg += "\n" + url
+
+        return self._plural_title, msg, urls[0] if len(urls) > 0 else None
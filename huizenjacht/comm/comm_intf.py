@@ -1,12 +1,23 @@
 from abc import ABC, abstractmethod
 
+from huizenjacht.comm.coalescer import Coalescer
+
+class CommError(Exception):
+    """
+    Raised when a message could not be delivered
+    """
+    pass
+
 class Comm(ABC):
     """
     Communication interface to update user.
     """
 
+    # Merges queued notifications into digests, None to merge whatever is due at the same time
+    coalescer: Coalescer | None = None
+
     """
-    Send a message to the user
+    Send a message to the user, raises CommError if it could not be delivered
     """
     @abstractmethod
     def send(self, msg: str, title: str, url: str) -> int:
@@ -18,4 +29,9 @@ class Comm(ABC):
     @abstractmethod
     def is_ready(self) -> bool:
         pass
-    
\ No newline at end of file
+
+    """
+    Retrieve the earliest time (epoch seconds) at which a message may be sent, to respect rate limits
+    """
+    def available_at(self) -> float:
+        return 0
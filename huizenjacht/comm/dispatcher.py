@@ -0,0 +1,175 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable
+
+from huizenjacht.comm.coalescer import Coalescer
+from huizenjacht.comm.comm_intf import Comm
+from huizenjacht.config import Config
+from huizenjacht.metrics import Metrics
+from huizenjacht.store.outbox import Outbox
+from huizenjacht.utils.clock import Clock
+
+
+class Dispatcher(threading.Thread):
+    """
+    Background thread that drains the outbox.
+    Every comm gets at most one message in flight at a time, but different comms are sent to in parallel. Queued
+    notifications are merged into digests by the coalescer of the comm. Each send has a timeout, failed and timed out
+    sends are retried with exponential backoff and comms that report a rate limit are left alone until it has passed.
+    Notifications for a comm that is no longer loaded, e.g. of a removed profile, are dropped once they are orphan_ttl
+    seconds old, which leaves a comm that is reloaded or comes back after a restart time to deliver them.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+    comms: dict[str, Comm]
+
+    # Private attributes
+    _outbox: Outbox
+    _send: Callable  # Called as send(comm, msg, title, url)
+    _executor: ThreadPoolExecutor
+    _coalescers: dict[str, Coalescer]
+    # Per comm: send, outbox ids, attempts, start time and time the oldest notification was queued
+    _in_flight: dict[str, tuple[Future, list[int], int, float, float]]
+    _wake: threading.Event
+    _stopping: threading.Event
+
+    def __init__(self, outbox: Outbox, comms: dict[str, Comm] | list[Comm], send: Callable):
+        super().__init__(name="dispatcher", daemon=True)
+        self.logger = logging.getLogger(__name__)
+
+        self.conf = {
+            "interval": 5,  # seconds between checks for due notifications
+            "send_timeout": 30,  # seconds
+            "retry_base": 10,  # seconds, delay after the first failed attempt
+            "retry_max": 3600,  # seconds, longest delay between attempts
+            "max_attempts": 10,  # notifications are dropped after this many failed attempts
+            "orphan_ttl": 24 * 3600,  # seconds, notifications for a comm that is not loaded are dropped at this age
+        } | Config().config["server"].get("outbox", {})
+
+        self._outbox = outbox
+        self._send = send
+        self.comms = {}
+        self.update_comms(comms)
+
+        # Leave room for sends that timed out but still hold their thread
+        self._executor = ThreadPoolExecutor(max_workers=max(2 * len(comms), 2), thread_name_prefix="send")
+        self._in_flight = {}
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    """Replace the set of comms that notifications are delivered to, by outbox name
+    A list of comms is keyed on class name."""
+    def update_comms(self, comms: dict[str, Comm] | list[Comm]):
+        if not isinstance(comms, dict):
+            comms = {type(c).__name__: c for c in comms}
+        self._coalescers = {name: c.coalescer or Coalescer() for name, c in comms.items()}
+        self.comms = comms
+
+    """Check for due notifications right away"""
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = None):
+        self._stopping.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                self.logger.error("Dispatching notifications failed", exc_info=e)
+
+            self._wake.wait(self.conf["interval"])
+            self._wake.clear()
+
+    """Send all notifications that are due, returns once nothing is left to send right now"""
+    def drain(self):
+        while not self._stopping.is_set():
+            self._collect()
+
+            # Group due notifications per comm
+            now = Clock().time()
+            due: dict[str, list[tuple]] = {}
+            for row in self._outbox.due(now):
+                due.setdefault(row[1], []).append(row)
+
+            for comm_name, rows in due.items():
+                comm = self.comms.get(comm_name)
+                coalescer = self._coalescers.get(comm_name)
+                if comm is None or coalescer is None:
+                    self._expire(comm_name, rows, now)
+                    continue
+                if comm_name in self._in_flight or comm.available_at() > now:
+                    continue
+                if not coalescer.ready(len(rows), now):
+                    continue
+
+                rows = rows[:coalescer.max_count]
+                title, msg, url = coalescer.merge([(title, msg, url) for _, _, title, msg, url, _, _ in rows])
+                coalescer.sent(now)
+
+                future = self._executor.submit(self._send, comm, msg, title, url)
+                future.add_done_callback(lambda _: self._wake.set())
+                self._in_flight[comm_name] = (
+                    future, [row[0] for row in rows], max(row[5] for row in rows), now, min(row[6] for row in rows)
+                )
+
+            if len(self._in_flight) == 0:
+                return
+
+            # Wait for the first send to finish or time out
+            deadline = min(v[3] for v in self._in_flight.values()) + self.conf["send_timeout"]
+            wait([v[0] for v in self._in_flight.values()], timeout=max(deadline - Clock().time(), 0),
+                 return_when=FIRST_COMPLETED)
+
+            if not any(v[0].done() for v in self._in_flight.values()) and Clock().time() < deadline:
+                return  # Only sends that have not timed out yet left, check again on the next wake-up
+
+    """Drop the notifications for a comm that is not loaded, once they are older than orphan_ttl"""
+    def _expire(self, comm_name: str, rows: list[tuple], now: float):
+        expired = [row[0] for row in rows if now - row[6] >= self.conf["orphan_ttl"]]
+        if len(expired) == 0:
+            return
+
+        self.logger.warning(f"Dropping {len(expired)} notifications to {comm_name}, which is no longer configured")
+        self._outbox.delivered(expired)
+        Metrics().inc("notifications_dropped_total", len(expired), comm=comm_name)
+
+    """Record the outcome of finished and timed out sends"""
+    def _collect(self):
+        now = Clock().time()
+        metrics = Metrics()
+        for comm_name, (future, notification_ids, attempts, start, created) in list(self._in_flight.items()):
+            if future.done():
+                error = future.exception()
+            elif now - start >= self.conf["send_timeout"]:
+                # The send cannot be interrupted, it is left to finish in the background while the comm moves on
+                future.cancel()
+                error = TimeoutError(f"No response within {self.conf['send_timeout']}s")
+            else:
+                continue
+
+            del self._in_flight[comm_name]
+            if error is None:
+                self._outbox.delivered(notification_ids)
+                metrics.inc("notifications_sent_total", len(notification_ids), comm=comm_name)
+                metrics.observe("notify_delay_seconds", now - created, comm=comm_name)
+                continue
+
+            metrics.inc("notification_failures_total", comm=comm_name)
+            attempts += 1
+            if attempts >= self.conf["max_attempts"]:
+                self.logger.error(f"Dropping notification to {comm_name} after {attempts} failed attempts: {error}")
+                self._outbox.delivered(notification_ids)
+                continue
+
+            delay = min(self.conf["retry_base"] * 2 ** (attempts - 1), self.conf["retry_max"])
+            self.logger.warning(f"Sending to {comm_name} failed, retrying in {delay}s: {error}")
+            self._outbox.failed(notification_ids, repr(error), now + delay)
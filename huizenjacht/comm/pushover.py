@@ -1,12 +1,32 @@
-from huizenjacht.comm import Comm
+from huizenjacht.comm import Comm, CommError
+from huizenjacht.comm.coalescer import Coalescer
 from huizenjacht.config import Config
 
 import time
 import logging
+import threading
 import chump
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
+# chump opens its connections without a timeout, so a stalled connection would block a send forever. Its connection
+# pool is shared by all applications, so it is wrapped once, and every comm sets its own timeout for the requests it
+# makes from the current thread
+_request_timeout = threading.local()
+_pool_open = chump.pool.open
+
+
+def _open_with_timeout(url, data=None):
+    return _pool_open(url, data, timeout=getattr(_request_timeout, "value", None) or Pushover.DEFAULT_TIMEOUT)
+
+
+chump.pool.open = _open_with_timeout
+
 class Pushover(Comm):
+    # Constants
+    MAX_MSG_LENGTH = 1024  # characters
+    DEFAULT_TIMEOUT = 20  # seconds, below the send_timeout of the outbox
+
     # Public class attributes
     logger: logging.Logger
     conf: dict
@@ -16,17 +36,25 @@ class Pushover(Comm):
     _rcpt: chump.User
     _default_title: str
 
-    def __init__(self):
+    """Set up Pushover from its config section, or from conf if given (e.g. a profile specific recipient)"""
+    def __init__(self, conf: dict = None):
         self.logger = logging.getLogger(__name__)
 
-        conf = Config().config
-        self._default_title = conf['server']['message_strings']['default_title']
-        self.conf = conf['comm']['pushover']
+        server_conf = Config().config
+        self._default_title = server_conf['server']['message_strings']['default_title']
+        self.conf = server_conf['comm']['pushover'] if conf is None else conf
         self._sanity_check_conf()
 
         self._pushover = chump.Application(token=self.conf['api_key'])
         self._rcpt = self._pushover.get_user(self.rcpt)
 
+        # Bursts of new houses are sent as a single digest, to save on the monthly message limit
+        self.coalescer = Coalescer(
+            window=self.conf.get("digest_window", 60),
+            max_count=self.conf.get("digest_max", 20),
+            max_length=self.MAX_MSG_LENGTH,
+        )
+
     def send(self, msg: str, title: str = None, url: str = None) -> chump.Message | None:
         msg = str(msg)
 
@@ -34,19 +62,39 @@ class Pushover(Comm):
             return None
 
         # Truncate msg size if necessary
-        msg = msg[:1020] + '...' if len(msg) >= 1024 else msg  # Limit msg length
+        if len(msg) >= self.MAX_MSG_LENGTH:  # Limit msg length
+            msg = msg[:self.MAX_MSG_LENGTH - 4] + '...'
 
         if title is None:
             title = self._default_title
 
         url_title = urlparse(url).netloc if url is not None else None
-        message = self._rcpt.create_message(message=msg, title=title, url=url, url_title=url_title)
-        message.send()
+        with self._timeout():
+            message = self._rcpt.create_message(message=msg, title=title, url=url, url_title=url_title)
+            if not message.send():
+                raise CommError(f"Pushover message not sent: {message.error}")
         return message
 
+    """Hold messages once the monthly message limit of the application has been reached"""
+    def available_at(self) -> float:
+        if self._pushover.remaining == 0 and self._pushover.reset is not None:
+            return self._pushover.reset.timestamp()
+        return 0
+
     """Check whether app and recipient are authenticated"""
     def is_ready(self) -> bool:
-        return self._pushover.is_authenticated and self._rcpt.is_authenticated
+        with self._timeout():
+            return self._pushover.is_authenticated and self._rcpt.is_authenticated
+
+    """Apply the timeout of this comm to the Pushover requests made from the current thread"""
+    @contextmanager
+    def _timeout(self):
+        previous = getattr(_request_timeout, "value", None)
+        _request_timeout.value = self.conf.get("timeout", self.DEFAULT_TIMEOUT)
+        try:
+            yield
+        finally:
+            _request_timeout.value = previous
 
     """Get recipient string
     Returns the string containing one or more user or group keys"""
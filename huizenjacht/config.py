@@ -58,6 +58,19 @@ class Config(metaclass=SingletonMeta):
 
         self._loaded_config_file = self.LOAD_TXT
 
+    """Reload config from the file it was last loaded from and return it
+    The current config is kept if the file cannot be read or parsed."""
+    def reload(self) -> dict:
+        if self._loaded_config_file in (None, self.LOAD_TXT):
+            raise ValueError("Configuration was not loaded from a file, cannot reload")
+
+        self.load(self._loaded_config_file)
+        return self._config
+
+    """Put back a configuration returned earlier, e.g. when a reloaded one turns out to be unusable"""
+    def restore(self, config: dict):
+        self._config = config
+
     """
     Main configuration getter, autoloads config file if not already loaded
     """
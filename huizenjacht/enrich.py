@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from huizenjacht.config import Config
+from huizenjacht.fetch import DiskCache, Fetcher
+from huizenjacht.metrics import Metrics
+from huizenjacht.source import Source
+from huizenjacht.utils.clock import Clock
+from huizenjacht.utils.user_agents import UserAgentPool
+
+
+class _HostState:
+    """Politeness state of a single host"""
+    lock: threading.Lock
+    next_request: float  # epoch seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_request = 0
+
+
+class Enricher:
+    """
+    Fetches and parses the detail pages of newly found houses.
+    Pages are fetched by a bounded pool of workers, requests to the same host are spaced at least per_host_delay
+    seconds apart. Responses are kept in an on-disk cache, so restarts and reseeds do not fetch a page twice. The
+    workers and the cache are only created when enrichment is active.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+
+    # Private attributes
+    _executor: ThreadPoolExecutor | None
+    _cache: DiskCache | None
+    _hosts: dict[str, _HostState]
+    _hosts_lock: threading.Lock
+    _ua: UserAgentPool
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.conf = {
+            "active": False,
+            "workers": 4,
+            "per_host_delay": 1.0,  # seconds between requests to the same host
+            "timeout": 30,  # seconds, maximum time spent enriching the houses of a single poll
+            "cache_dir": "cache",  # None disables the cache
+            "cache_ttl": 7 * 24 * 3600,  # seconds
+            "cache_max_mb": 100,
+        } | Config().config["server"].get("enrichment", {})
+
+        self._executor = None
+        self._cache = None
+        if self.active:
+            self._executor = ThreadPoolExecutor(max_workers=self.conf["workers"], thread_name_prefix="enrich")
+        if self.active and self.conf["cache_dir"] is not None:
+            self._cache = DiskCache(self.conf["cache_dir"], ttl=self.conf["cache_ttl"],
+                                    max_bytes=int(self.conf["cache_max_mb"] * 1024 * 1024))
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._ua = UserAgentPool()
+
+    @property
+    def active(self) -> bool:
+        return self.conf["active"]
+
+    """Return a record of properties for every house that could be enriched within the timeout"""
+    def enrich(self, source: Source, houses: list[str]) -> dict[str, dict]:
+        if not houses or self._executor is None:
+            return {}
+
+        futures = {self._executor.submit(self._enrich_one, source, house): house for house in houses}
+        done, not_done = wait(futures, timeout=self.conf["timeout"])
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            self.logger.warning(f"Enrichment of {len(not_done)} houses from {source.name} timed out")
+
+        records = {}
+        for future in done:
+            try:
+                record = future.result()
+            except Exception as e:
+                self.logger.warning(f"Failed to enrich {futures[future]}: {e}")
+                continue
+            if record is not None:
+                records[futures[future]] = record
+
+        return records
+
+    def _enrich_one(self, source: Source, url: str) -> dict | None:
+        metrics = Metrics()
+        source_name = source.name
+
+        page = self._cache.get(url) if self._cache is not None else None
+        metrics.inc("detail_requests_total", source=source_name, cache="hit" if page is not None else "miss")
+        if page is None:
+            self._wait_for_host(urlsplit(url).hostname)
+            with metrics.timer("detail_fetch_seconds", source=source_name):
+                res = Fetcher().get(url, headers={"User-Agent": self._ua.random}, conditional=False)
+            if not res.ok:
+                self.logger.info(f"Could not fetch detail page {url}: {res.error or res.status}")
+                return None
+            page = res.text
+            if self._cache is not None:
+                self._cache.put(url, page)
+
+        return source.parse_detail(page, url)
+
+    """Block until the next request to host is allowed"""
+    def _wait_for_host(self, host: str):
+        with self._hosts_lock:
+            state = self._hosts.setdefault(host, _HostState())
+
+        with state.lock:
+            now = Clock().time()
+            if state.next_request > now and not Clock().simulated:
+                time.sleep(state.next_request - now)
+            state.next_request = max(now, state.next_request) + self.conf["per_host_delay"]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_record(record: dict) -> str:
+    """Format a record as a short human readable summary"""
+    lines = []
+
+    address = " ".join(str(record[k]) for k in ("street", "postcode", "city") if record.get(k))
+    if address:
+        lines.append(address)
+
+    facts = []
+    if "price" in record:
+        facts.append(f"€ {record['price']:,}".replace(",", "."))
+    if "living_area" in record:
+        facts.append(f"{record['living_area']} m²")
+    if "rooms" in record:
+        facts.append(f"{record['rooms']} kamers")
+    if "energy_label" in record:
+        facts.append(f"energielabel {record['energy_label']}")
+    if facts:
+        lines.append(" · ".join(facts))
+
+    return "\n".join(lines)
@@ -0,0 +1,14 @@
+__all__ = [
+    "Archive",
+    "DiskCache",
+    "Fetcher",
+    "FetchResult",
+    "Governor",
+    "HostUnavailableError",
+    "Recorder",
+]
+
+from .archive import Archive, Recorder
+from .disk_cache import DiskCache
+from .fetcher import Fetcher, FetchResult
+from .governor import Governor, HostUnavailableError
@@ -0,0 +1,186 @@
+import bisect
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import zlib
+
+from huizenjacht.fetch.fetcher import FetchResult
+
+
+class Recorder:
+    """
+    Appends every response the Fetcher receives to a gzip compressed log of JSON lines.
+    A body is written once, later responses with an identical body refer to it by hash. The start of every cycle is
+    marked, so that a replay can tell which responses belong together. Every record is flushed when it is written, so
+    the log is usable up to the last response even if the daemon is killed.
+    """
+
+    # Constants
+    HEADERS = ("Content-Type", "ETag", "Last-Modified")  # Response headers that are kept
+
+    # Public attributes
+    logger: logging.Logger
+    path: str
+
+    # Private attributes
+    _file: gzip.GzipFile
+    _bodies: set[str]  # Hashes of the bodies written so far
+    _lock: threading.Lock
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._bodies = set()
+        self._lock = threading.Lock()
+
+    """Append a response that was requested at time t"""
+    def record(self, result: FetchResult, t: float):
+        body = None
+        entries = []
+        if result.text is not None:
+            body = hashlib.blake2b(result.text.encode(), digest_size=16).hexdigest()
+            if body not in self._bodies:
+                entries.append({"body": body, "text": result.text})
+        entries.append({
+            "t": t,
+            "url": result.url,
+            "status": result.status,
+            "headers": {k: v for k, v in result.headers.items() if k in self.HEADERS},
+            "body": body,
+            "truncated": result.truncated,
+            "error": None if result.error is None else repr(result.error),
+        })
+
+        with self._lock:
+            for entry in entries:
+                self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            if body is not None:
+                self._bodies.add(body)
+
+    """Mark the start of a cycle at time t, the responses recorded until the next mark belong to it"""
+    def mark_cycle(self, t: float):
+        with self._lock:
+            self._file.write(json.dumps({"cycle": t}) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Archive:
+    """
+    Responses from a log written by Recorder, to be served again in replay mode.
+    A request is answered with the last response that was recorded for the same URL in the recorded cycle that had
+    started by the given time, or before it. The simulated clock stands still during a cycle, while the requests of a
+    recorded cycle are spread out over a few seconds. A recorded 304 is answered like the server would have answered
+    the replaying Fetcher: with the last recorded page, or with a 304 if the validators it sends along still match.
+    Bodies are kept compressed in memory.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    start: float | None  # Time of the first recorded response
+    end: float | None  # Time of the last recorded response
+
+    # Private attributes
+    _bodies: dict[str, bytes]
+    _times: dict[str, list[float]]  # Record times per URL, ascending
+    _records: dict[str, list[dict]]  # Records per URL, in the same order
+    _full: dict[str, list[int]]  # Per record, index of the last record of the same URL that holds a body, or -1
+    _cycles: list[float]  # Start times of the recorded cycles, ascending
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger(__name__)
+        self._bodies = {}
+        self._times = {}
+        self._records = {}
+        self._cycles = []
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    self._load(json.loads(line))
+            except (EOFError, json.JSONDecodeError):
+                self.logger.warning(f"{path} ends with an incomplete record, which is skipped")
+
+        self._full = {}
+        for url, records in self._records.items():
+            last = -1
+            self._full[url] = []
+            for i, record in enumerate(records):
+                if record["body"] is not None:
+                    last = i
+                self._full[url].append(last)
+
+        times = [t for times in self._times.values() for t in times]
+        self.start = min(times, default=None)
+        self.end = max(times, default=None)
+        self.logger.info(f"Loaded {len(times)} responses for {len(self._records)} URLs from {path}")
+
+    def _load(self, entry: dict):
+        if "text" in entry:
+            self._bodies[entry["body"]] = zlib.compress(entry["text"].encode())
+            return
+        if "cycle" in entry:
+            bisect.insort(self._cycles, entry["cycle"])
+            return
+
+        url = entry["url"]
+        i = bisect.bisect_right(self._times.setdefault(url, []), entry["t"])
+        self._times[url].insert(i, entry["t"])
+        self._records.setdefault(url, []).insert(i, entry)
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._records.values())
+
+    """
+    Return the response to a request for url with request headers at time t, or None if nothing was recorded for it by
+    then
+    """
+    def get(self, url: str, t: float, headers: dict = None) -> FetchResult | None:
+        times = self._times.get(url, [])
+        c = bisect.bisect_right(self._cycles, t)
+        if c == 0:
+            i = bisect.bisect_right(times, t)
+        elif c == len(self._cycles):
+            i = len(times)  # Within the last recorded cycle
+        else:
+            i = bisect.bisect_left(times, self._cycles[c])  # Up to the start of the next recorded cycle
+        if i == 0:
+            return None
+
+        entry = self._records[url][i - 1]
+        if entry["status"] == 304:
+            full = self._full[url][i - 1]
+            if full == -1:
+                return None
+            entry = self._records[url][full]
+
+        if entry["status"] == 200 and self._matches(entry["headers"], headers or {}):
+            return FetchResult(url=url, status=304, headers=entry["headers"])
+
+        text = None
+        if entry["body"] is not None:
+            text = zlib.decompress(self._bodies[entry["body"]]).decode()
+        return FetchResult(
+            url=url,
+            status=entry["status"],
+            text=text,
+            headers=entry["headers"],
+            error=None if entry["error"] is None else ConnectionError(entry["error"]),
+            truncated=entry["truncated"],
+        )
+
+    """Whether the validators of a conditional request match the response headers of a recorded page"""
+    @staticmethod
+    def _matches(response_headers: dict, request_headers: dict) -> bool:
+        etag = request_headers.get("If-None-Match")
+        if etag is not None and etag == response_headers.get("ETag"):
+            return True
+        modified = request_headers.get("If-Modified-Since")
+        return modified is not None and modified == response_headers.get("Last-Modified")
@@ -0,0 +1,78 @@
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class DiskCache:
+    """
+    Compressed on-disk cache of response bodies, keyed on url.
+    Entries expire after ttl seconds. Once the cache grows beyond max_bytes, the least recently written entries are
+    evicted. The cache survives restarts.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    directory: Path
+    ttl: float  # seconds
+    max_bytes: int
+
+    # Private attributes
+    _size: int  # Bytes currently on disk
+    _lock: threading.Lock
+
+    def __init__(self, directory: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 100 * 1024 * 1024):
+        self.logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(f.stat().st_size for f in self.directory.glob("*/*.gz"))
+
+    def get(self, url: str) -> str | None:
+        path = self._path(url)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def put(self, url: str, text: str):
+        path = self._path(url)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(text)
+
+        with self._lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp, path)
+            self._size += path.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    """Remove expired entries and then the oldest ones until the cache is at 90% of its maximum size"""
+    def _evict(self):
+        entries = sorted(((f.stat().st_mtime, f.stat().st_size, f) for f in self.directory.glob("*/*.gz")),
+                         key=lambda entry: entry[0])
+        now = time.time()
+        for mtime, size, path in entries:
+            if self._size <= self.max_bytes * 0.9 and now - mtime <= self.ttl:
+                break
+            try:
+                path.unlink()
+                self._size -= size
+            except OSError:
+                pass
+        self.logger.debug(f"Evicted cache entries, {self._size} bytes left")
+
+    def _path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.gz"
@@ -0,0 +1,179 @@
+import codecs
+import logging
+import threading
+from typing import Callable, TYPE_CHECKING
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from huizenjacht.fetch.governor import Governor, HostUnavailableError
+from huizenjacht.utils.clock import Clock
+from huizenjacht.utils.singleton import SingletonMeta
+
+if TYPE_CHECKING:
+    from huizenjacht.fetch.archive import Archive, Recorder
+
+
+@dataclass
+class FetchResult:
+    """Outcome of a single request made through the Fetcher"""
+    url: str
+    status: int | None = None  # None if no response was received at all
+    text: str | None = None
+    headers: dict = field(default_factory=dict)
+    error: Exception | None = None
+    truncated: bool = False  # Body was not read to the end, see Fetcher.get()
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+
+class Fetcher(metaclass=SingletonMeta):
+    """
+    HTTP layer shared by all sources.
+    Keeps a single pooled keep-alive session, asks for compressed responses and remembers the ETag and Last-Modified
+    validators of every URL, so that unchanged pages are answered with an empty 304 response.
+    Every request goes through the Governor, which limits the rate per host and stops sending to hosts that keep failing.
+    If a recorder is set, every response is appended to it. If an archive is set, no requests are made at all and
+    every request is answered from the archive at the current time of the Clock.
+    """
+
+    # Constants
+    POOL_SIZE = 10  # connections kept alive per host
+    CHUNK_SIZE = 16 * 1024  # bytes
+
+    # Public attributes
+    logger: logging.Logger
+    governor: Governor
+    recorder: "Recorder | None"
+    archive: "Archive | None"
+
+    # Private attributes
+    _session: requests.Session
+    _validators: dict[str, dict[str, str]]  # Conditional request headers per full request URL
+    _lock: threading.Lock
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.POOL_SIZE, pool_maxsize=self.POOL_SIZE)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # Advertise every encoding urllib3 can decode, which includes brotli if it is installed
+        self._session.headers["Accept-Encoding"] = make_headers(accept_encoding=True)["accept-encoding"]
+
+        self.governor = Governor()
+        self.recorder = None
+        self.archive = None
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    """
+    Perform a GET request
+    timeout overrides the read timeout of the Governor, in seconds.
+    If conditional is set, the validators of the previous successful response for the same URL are sent along,
+    and a 304 result means the page has not changed since.
+    If stop is given, the body is streamed and stop is called with every decoded chunk. Reading stops as soon as it
+    returns True, in which case the result is marked truncated. Note that a connection that is not read to the end
+    cannot be reused.
+    """
+    def get(self, url: str, params: dict = None, headers: dict = None, timeout: float = None,
+            conditional: bool = True, stop: Callable[[str], bool] = None) -> FetchResult:
+        req = self._session.prepare_request(requests.Request("GET", url, params=params, headers=headers))
+
+        if conditional:
+            with self._lock:
+                req.headers.update(self._validators.get(req.url, {}))
+
+        if self.archive is not None:
+            result = self.archive.get(req.url, Clock().time(), req.headers)
+            if result is None:
+                return FetchResult(url=req.url, error=ConnectionError("No response recorded for this URL yet"))
+            if conditional and result.ok:
+                self._remember(req.url, result.headers)
+            return result
+
+        host = urlsplit(req.url).hostname
+        try:
+            self.governor.acquire(host)
+        except HostUnavailableError as e:
+            return FetchResult(url=req.url, error=e)
+
+        requested_at = Clock().time()
+        timeouts = (self.governor.conf["connect_timeout"], timeout or self.governor.conf["read_timeout"])
+        try:
+            res = self._session.send(req, timeout=timeouts, stream=stop is not None)
+            text, truncated = None, False
+            if res.status_code == 200:
+                text, truncated = self._read(res, stop) if stop is not None else (res.text, False)
+            res.close()
+        except requests.RequestException as e:
+            self.governor.release(host, None)
+            return self._record(FetchResult(url=req.url, error=e), requested_at)
+        self.governor.release(host, res.status_code, res.headers.get("Retry-After"))
+
+        if conditional and res.status_code == 200:
+            self._remember(req.url, res.headers)
+
+        return self._record(FetchResult(
+            url=req.url,
+            status=res.status_code,
+            text=text,
+            headers=dict(res.headers),
+            truncated=truncated,
+        ), requested_at)
+
+    """Remember the validators of a successful response, to be sent along with the next request for url"""
+    def _remember(self, url: str, headers):
+        validators = {}
+        if "ETag" in headers:
+            validators["If-None-Match"] = headers["ETag"]
+        if "Last-Modified" in headers:
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+        with self._lock:
+            self._validators[url] = validators
+
+    def _record(self, result: FetchResult, requested_at: float) -> FetchResult:
+        if self.recorder is not None:
+            try:
+                self.recorder.record(result, requested_at)
+            except OSError as e:
+                self.logger.warning(f"Could not record response from {result.url}: {e}")
+        return result
+
+    """Read a streamed response until stop returns True or the body ends"""
+    def _read(self, res: requests.Response, stop: Callable[[str], bool]) -> (str, bool):
+        decoder = codecs.getincrementaldecoder(res.encoding or "utf-8")(errors="replace")
+        parts = []
+        for chunk in res.iter_content(chunk_size=self.CHUNK_SIZE):
+            parts.append(decoder.decode(chunk))
+            if stop(parts[-1]):
+                return "".join(parts), True
+
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts), False
+
+    """
+    Forget the validators of a URL, forcing the next request to return the full page
+    Use this when a response could not be processed, so its content is not skipped on the next poll.
+    """
+    def forget(self, url: str):
+        with self._lock:
+            self._validators.pop(url, None)
+
+    """Close all pooled connections"""
+    def close(self):
+        self._session.close()
+        self.governor.save()
+        if self.recorder is not None:
+            self.recorder.close()
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from huizenjacht.config import Config
+from huizenjacht.metrics import Metrics
+from huizenjacht.utils.clock import Clock
+
+
+class HostUnavailableError(Exception):
+    """A request was not sent, because the circuit of its host is open or its rate limit would be exceeded"""
+    pass
+
+
+class _HostState:
+    """Rate limit and circuit breaker state of a single host"""
+    lock: threading.Lock
+    rate: float  # requests per second, adapted to what the host tolerates
+    tokens: float  # may go negative while requests are waiting for their turn
+    updated: float  # epoch seconds at which tokens was last refilled
+    failures: int  # consecutive failed requests
+    open_until: float  # epoch seconds, 0 if the circuit is closed
+    open_time: float  # seconds the circuit was opened for the last time
+    probing: bool  # a half-open probe is under way
+
+    def __init__(self, rate: float, burst: float, open_time: float):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.tokens = burst
+        self.updated = Clock().time()
+        self.failures = 0
+        self.open_until = 0
+        self.open_time = open_time
+        self.probing = False
+
+    def to_dict(self) -> dict:
+        return {"rate": self.rate, "failures": self.failures, "open_until": self.open_until,
+                "open_time": self.open_time}
+
+
+class Governor:
+    """
+    Request governance per host, applied by the Fetcher to every request of every source.
+    Each host has a token bucket whose rate adapts to what the host tolerates: it grows a little with every successful
+    request and halves on every 429. After failure_threshold consecutive failures (429, 5xx or no response at all) the
+    circuit of the host opens and requests fail right away until open_time has passed, or the Retry-After of the host if
+    that is later. Then a single probe is let through, which closes the circuit if it succeeds and otherwise opens it
+    again for twice as long. The state of all hosts is kept in a file next to the database, so a restart does not
+    forget that a host has just blocked us.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+    file: Path
+
+    # Private attributes
+    _hosts: dict[str, _HostState]
+    _hosts_lock: threading.Lock
+    _saved: dict[str, dict]  # State read from the file, for hosts that have not been requested yet
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+        server_conf = Config().config["server"]
+        self.conf = {
+            "file": Path(server_conf["db"]).parent / "hosts.json",
+            "rate": 0.5,  # requests per second per host to start with
+            "min_rate": 0.01,  # requests per second
+            "max_rate": 2,  # requests per second
+            "increase": 0.01,  # requests per second added to the rate after every successful request
+            "burst": 5,  # requests that may be sent at once after a quiet period
+            "max_wait": 10,  # seconds, a request that would have to wait longer for its turn fails right away
+            "connect_timeout": 5,  # seconds
+            "read_timeout": 30,  # seconds
+            "failure_threshold": 5,  # consecutive failures after which the circuit opens
+            "open_time": 60,  # seconds the circuit stays open at first
+            "max_open_time": 3600,  # seconds
+            "hosts": {},  # overrides of the settings above per host name
+        } | server_conf.get("fetch", {})
+        self.file = Path(self.conf["file"])
+
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._saved = self._load()
+
+    """Settings for a single host, with its overrides applied"""
+    def host_conf(self, host: str) -> dict:
+        return self.conf | self.conf["hosts"].get(host, {})
+
+    """
+    Wait for the turn of the next request to host
+    Raises HostUnavailableError if the circuit of the host is open, or if the wait would exceed max_wait.
+    """
+    def acquire(self, host: str):
+        conf = self.host_conf(host)
+        state = self._state(host, conf)
+
+        with state.lock:
+            now = Clock().time()
+            if state.open_until > now:
+                raise HostUnavailableError(f"Circuit of {host} is open for another {state.open_until - now:.0f}s")
+            if state.open_until > 0:  # Half-open
+                if state.probing:
+                    raise HostUnavailableError(f"Waiting for the probe of {host}")
+                state.probing = True
+
+            state.tokens = min(state.tokens + (now - state.updated) * state.rate, conf["burst"])
+            state.updated = now
+            wait = (1 - state.tokens) / state.rate if state.tokens < 1 else 0
+            if wait > conf["max_wait"]:
+                state.probing = False
+                raise HostUnavailableError(f"Rate limit of {host} exceeded, next request in {wait:.0f}s")
+            state.tokens -= 1  # Reserve a token, so that concurrent requests queue up behind this one
+
+        if wait > 0:
+            Metrics().observe("rate_limit_wait_seconds", wait, host=host)
+            if not Clock().simulated:
+                time.sleep(wait)
+
+    """
+    Register the outcome of a request to host
+    status is the HTTP status code, or None if no response was received. retry_after is the value of the Retry-After
+    header of the response, if any.
+    """
+    def release(self, host: str, status: int | None, retry_after: str = None):
+        conf = self.host_conf(host)
+        state = self._state(host, conf)
+        failed = status is None or status == 429 or status >= 500
+        delay = self._parse_retry_after(retry_after) if retry_after is not None else 0
+
+        with state.lock:
+            now = Clock().time()
+            changed = False
+
+            if status == 429:
+                state.rate = max(state.rate / 2, conf["min_rate"])
+                self.logger.info(f"{host} asked to slow down, lowered rate to {state.rate:.3f} requests/s")
+                changed = True
+            elif not failed:
+                state.rate = min(state.rate + conf["increase"], conf["max_rate"])
+
+            if failed:
+                state.failures += 1
+                if state.probing or state.failures >= conf["failure_threshold"] or delay > 0:
+                    state.open_time = min(state.open_time * 2, conf["max_open_time"]) if state.probing \
+                        else conf["open_time"]
+                    state.open_until = now + max(state.open_time, delay)
+                    self.logger.warning(f"Opened circuit of {host} for {state.open_until - now:.0f}s after "
+                                        f"{state.failures} failed requests")
+                    Metrics().inc("circuit_opened_total", host=host)
+                    changed = True
+            else:
+                if state.open_until > 0:
+                    self.logger.info(f"Closed circuit of {host}")
+                    changed = True
+                state.failures = 0
+                state.open_until = 0
+                state.open_time = conf["open_time"]
+            state.probing = False
+
+        if changed:
+            self.save()
+
+    """Write the state of all hosts to the state file"""
+    def save(self):
+        if not self._hosts:
+            return  # Nothing was requested, the file is still up to date
+
+        with self._hosts_lock:
+            hosts = self._saved | {host: state.to_dict() for host, state in self._hosts.items()}
+
+        tmp = self.file.with_suffix(".tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump(hosts, f, indent=1)
+            os.replace(tmp, self.file)
+        except OSError as e:
+            self.logger.warning(f"Could not save host state to {self.file}: {e}")
+
+    def _state(self, host: str, conf: dict) -> _HostState:
+        with self._hosts_lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = _HostState(conf["rate"], conf["burst"], conf["open_time"])
+                saved = self._saved.get(host, {})
+                state.rate = min(max(saved.get("rate", state.rate), conf["min_rate"]), conf["max_rate"])
+                state.failures = saved.get("failures", 0)
+                state.open_until = saved.get("open_until", 0)
+                state.open_time = saved.get("open_time", state.open_time)
+                self._hosts[host] = state
+            return state
+
+    def _load(self) -> dict[str, dict]:
+        try:
+            with open(self.file) as f:
+                hosts = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Could not read host state from {self.file}, starting afresh: {e}")
+            return {}
+        return hosts if isinstance(hosts, dict) else {}
+
+    """Seconds to wait according to a Retry-After header, which holds either seconds or an HTTP date"""
+    @staticmethod
+    def _parse_retry_after(value: str) -> float:
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - Clock().time(), 0)
+        except (TypeError, ValueError):
+            return 0
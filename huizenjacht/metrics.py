@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from huizenjacht.utils.singleton import SingletonMeta
+
+
+class _Histogram:
+    """Cumulative histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(metaclass=SingletonMeta):
+    """
+    Process-wide store of counters, gauges and histograms.
+    Everything can be rendered in the Prometheus text exposition format, which is served over HTTP by MetricsServer
+    and can also be written to a stats file.
+    """
+
+    # Constants
+    PREFIX = "huizenjacht_"
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+
+    # Public attributes
+    logger: logging.Logger
+
+    # Private attributes
+    _counters: dict[tuple[str, tuple], float]
+    _gauges: dict[tuple[str, tuple], float | Callable[[], float]]
+    _histograms: dict[tuple[str, tuple], _Histogram]
+    _help: dict[str, str]
+    _lock: threading.Lock
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    """Add value to a counter"""
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    """Sum of a counter over all its labels"""
+    def total(self, name: str) -> float:
+        with self._lock:
+            return sum(v for (n, _), v in self._counters.items() if n == name)
+
+    """Set a gauge to a value, or to a function that is evaluated whenever the metrics are rendered"""
+    def set(self, name: str, value: float | Callable[[], float], **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    """Add a value to a histogram"""
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(self.DEFAULT_BUCKETS)
+            self._histograms[key].observe(value)
+
+    """Measure the duration of a block into a histogram"""
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    """Render all metrics in the Prometheus text format"""
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f"# TYPE {self.PREFIX}{name} {kind}")
+                    for (n, labels), value in sorted(metrics.items(), key=lambda item: item[0]):
+                        if n == name:
+                            value = value() if callable(value) else value
+                            lines.append(f"{self.PREFIX}{name}{self._labels(labels)} {value:g}")
+
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {self.PREFIX}{name} histogram")
+                for (n, labels), hist in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f"{self.PREFIX}{name}_bucket{self._labels(labels + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{self.PREFIX}{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{self.PREFIX}{name}_sum{self._labels(labels)} {hist.sum:g}")
+                    lines.append(f"{self.PREFIX}{name}_count{self._labels(labels)} {hist.count}")
+
+        return "\n".join(lines) + "\n"
+
+    """Atomically write all metrics to a file"""
+    def write(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _labels(labels: tuple) -> str:
+        if len(labels) == 0:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving the metrics at /metrics"""
+
+    # Public attributes
+    logger: logging.Logger
+
+    # Private attributes
+    _server: ThreadingHTTPServer
+    _thread: threading.Thread
+
+    def __init__(self, address: str = "127.0.0.1", port: int = 9464):
+        self.logger = logging.getLogger(__name__)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = Metrics().render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((address, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Serving metrics on http://{address}:{self._server.server_port}/metrics")
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,112 @@
+import logging
+import sqlite3
+
+from huizenjacht.comm import COMMS, Comm
+from huizenjacht.config import Config
+from huizenjacht.source import Source
+from huizenjacht.store import SeenStore
+
+
+class Profile:
+    """
+    Search profile of a single household in multi-profile mode.
+    Profiles share the fetches of the configured sources, so every query is fetched once per cycle no matter how many
+    profiles use it. Houses that are new to a source are matched against the filter of every profile and fanned out
+    to the comms of the profiles they match. Every profile keeps its own seen state per source.
+    Values that are unknown for a house, e.g. because it could not be enriched, never filter it out.
+    """
+
+    # Constants
+    DB_TABLE_PREFIX = "Profile"
+
+    # Public attributes
+    logger: logging.Logger
+    name: str
+    conf: dict
+    comms: dict[str, Comm]  # By outbox name
+
+    # Private attributes
+    _conn: sqlite3.Connection
+    _stores: dict[str, SeenStore]  # By source name
+    _property_types: set[str] | None
+    _areas: set[str] | None
+
+    def __init__(self, name: str, db: sqlite3.Connection):
+        self.logger = logging.getLogger(f"{__name__}.{name}")
+        self.name = "".join(c for c in str(name) if c.isalnum() or c == "_")
+        self.conf = Config().config["profiles"][name]
+        self._conn = db
+        self._stores = {}
+
+        property_types = self.conf.get("property_type")
+        if isinstance(property_types, str):
+            property_types = [property_types]
+        try:
+            self._property_types = None if property_types is None else \
+                {Source.PROPERTY_TYPES[t] for t in property_types}
+        except KeyError:
+            raise KeyError(f"Config value 'property_type' in profile {name} contains an entry that is not one of "
+                           f"{list(Source.PROPERTY_TYPES)}")
+
+        areas = self.conf.get("areas")
+        if isinstance(areas, str):
+            areas = [areas]
+        self._areas = None if areas is None else {a.lower() for a in areas}
+
+        # Comm entries of a profile override the top-level comm entries, so credentials can be shared
+        comm_conf = Config().config.get("comm", {})
+        self.comms = {}
+        for key, entry in self.conf.get("comm", {}).items():
+            entry = comm_conf.get(key, {}) | entry
+            if not entry.get("active"):
+                continue
+            comm = COMMS.get(key)(entry)
+            self.comms[f"{self.name}/{type(comm).__name__}"] = comm
+
+    """Check whether a house matches the filter of this profile, given its record if it was enriched"""
+    def matches(self, record: dict | None) -> bool:
+        record = record or {}
+
+        def within(key: str, minimum: str, maximum: str = None) -> bool:
+            value = record.get(key)
+            if value is None:
+                return True
+            if self.conf.get(minimum) and value < self.conf[minimum]:
+                return False
+            if maximum is not None and self.conf.get(maximum) and value > self.conf[maximum]:
+                return False
+            return True
+
+        if not (within("price", "min_price", "max_price")
+                and within("rooms", "min_rooms", "max_rooms")
+                and within("living_area", "min_living_area")):
+            return False
+
+        property_type = record.get("property_type")
+        if self._property_types is not None and property_type is not None \
+                and property_type not in self._property_types:
+            return False
+
+        city = record.get("city")
+        if self._areas is not None and city is not None and city.lower() not in self._areas:
+            return False
+
+        return True
+
+    """Return the houses that match this profile and that it has not seen yet, marking them as seen
+    The transaction is left open for the caller to commit if commit is False."""
+    def filter_new(self, source: Source, houses: list, records: dict[str, dict], commit: bool = True) -> list:
+        matched = [house for house in houses if self.matches(records.get(house))]
+        if not matched:
+            return []
+        return self._store(source).filter_new(matched, commit=commit)
+
+    """Mark houses as seen without notifying"""
+    def seed(self, source: Source, houses: list):
+        self._store(source).filter_new(houses)
+
+    def _store(self, source: Source) -> SeenStore:
+        source_name = source.name
+        if source_name not in self._stores:
+            self._stores[source_name] = SeenStore(self._conn, f"{self.DB_TABLE_PREFIX}_{self.name}_{source_name}")
+        return self._stores[source_name]
@@ -0,0 +1,150 @@
+import logging
+import random
+import time
+
+from huizenjacht.config import Config
+from huizenjacht.source import Source
+from huizenjacht.utils.clock import Clock
+
+
+class _SourceState:
+    """Scheduling state of a single source"""
+    next_due: float  # epoch seconds
+    interval: float  # seconds, last computed interval
+    backoff: int  # number of consecutive failed polls
+    hot: int  # number of upcoming polls that are still shortened after new houses were found
+
+    def __init__(self, next_due: float):
+        self.next_due = next_due
+        self.interval = 0
+        self.backoff = 0
+        self.hot = 0
+
+
+class Scheduler:
+    """
+    Adaptive poll scheduler keeping a separate next-due time for every source.
+    Starting from the configured poll_time_min/poll_time_max, the interval of a source is shortened for a few polls
+    after new houses were found and during hours that have historically been busy, and lengthened during quiet
+    hours and after failed polls (429, 5xx or no response). All intervals are jittered.
+    """
+
+    # Constants
+    HOURS = 24
+    MIN_HISTORY = 24  # Number of observed new houses before hourly activity is taken into account
+    HISTORY_DECAY = 0.99  # Weight of history kept after every poll with new houses
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+
+    # Private attributes
+    _state: dict[Source, _SourceState]
+    _activity: list[float]  # Decayed count of new houses per hour of day
+
+    def __init__(self, sources: list[Source], now: float = None):
+        self.logger = logging.getLogger(__name__)
+        self.update_conf()
+
+        now = Clock().time() if now is None else now
+        self._state = {}
+        self._activity = [0.0] * self.HOURS
+        self.update_sources(sources, now)
+
+    """(Re)read the scheduling configuration, intervals change from the next recorded poll on"""
+    def update_conf(self):
+        server_conf = Config().config["server"]
+        self.conf = {
+            "poll_time_min": server_conf.get("poll_time_min", 240),  # seconds
+            "poll_time_max": server_conf.get("poll_time_max", 360),  # seconds
+            "min_interval": 0,  # seconds, lower bound for any interval
+            "max_interval": 3600,  # seconds, upper bound for any interval
+            "hot_factor": 0.5,  # interval multiplier after new houses were found
+            "hot_polls": 3,  # number of polls the hot factor applies to
+            "busy_factor": 0.5,  # strongest interval multiplier in busy hours
+            "quiet_hours": [1, 7],  # [start, end) local hours with a longer interval
+            "quiet_factor": 3,  # interval multiplier during quiet hours
+            "jitter": 0.2,  # relative random deviation of every interval
+        } | server_conf.get("scheduler", {})
+
+    """Track a new set of sources, keeping the state of sources that were already known"""
+    def update_sources(self, sources: list[Source], now: float = None):
+        now = Clock().time() if now is None else now
+        self._state = {s: self._state.get(s, _SourceState(next_due=now)) for s in sources}
+
+    """Make all sources due right away"""
+    def reset(self, now: float = None):
+        now = Clock().time() if now is None else now
+        for state in self._state.values():
+            state.next_due = now
+
+    """Return all sources that are due for polling"""
+    def due(self, now: float = None) -> list[Source]:
+        now = Clock().time() if now is None else now
+        return [s for s, state in self._state.items() if state.next_due <= now]
+
+    """Return the number of seconds until the next source is due"""
+    def time_until_due(self, now: float = None) -> float:
+        now = Clock().time() if now is None else now
+        if len(self._state) == 0:
+            return self.conf["max_interval"]
+        return max(min(state.next_due for state in self._state.values()) - now, 0)
+
+    """
+    Register the outcome of a poll and schedule the next one
+    status is the HTTP status code of the poll, or None if no response was received.
+    """
+    def record(self, source: Source, new_count: int, status: int | None, now: float = None):
+        now = Clock().time() if now is None else now
+        state = self._state.get(source)
+        if state is None:
+            return
+
+        hour = time.localtime(now).tm_hour
+
+        if status is None or status == 429 or status >= 500:
+            state.backoff += 1
+        else:
+            state.backoff = 0
+
+        if new_count > 0:
+            state.hot = self.conf["hot_polls"]
+            self._activity = [a * self.HISTORY_DECAY for a in self._activity]
+            self._activity[hour] += new_count
+        elif state.hot > 0:
+            state.hot -= 1
+
+        state.interval = self._interval(source, state, hour)
+        state.next_due = now + state.interval
+        self.logger.debug(f"Next poll of {source.name} in {state.interval:.0f}s")
+
+    def _interval(self, source: Source, state: _SourceState, hour: int) -> float:
+        interval = random.uniform(
+            source.conf_value("poll_time_min", self.conf["poll_time_min"]),
+            source.conf_value("poll_time_max", self.conf["poll_time_max"]),
+        )
+
+        if state.backoff > 0:
+            # Exponential backoff, unaffected by any of the speed-ups
+            interval *= 2 ** state.backoff
+        else:
+            if state.hot > 0:
+                interval *= self.conf["hot_factor"]
+            interval *= self._hour_factor(hour)
+
+        interval *= random.uniform(1 - self.conf["jitter"], 1 + self.conf["jitter"])
+        return min(max(interval, self.conf["min_interval"]), self.conf["max_interval"])
+
+    """Interval multiplier for the given hour, based on configured quiet hours and observed activity"""
+    def _hour_factor(self, hour: int) -> float:
+        start, end = self.conf["quiet_hours"]
+        if (start <= hour < end) if start <= end else (hour >= start or hour < end):
+            return self.conf["quiet_factor"]
+
+        total = sum(self._activity)
+        if total < self.MIN_HISTORY:
+            return 1
+
+        # Relative activity of this hour, 1 is average
+        activity = self._activity[hour] * self.HOURS / total
+        return min(max(1 / activity if activity > 0 else 2, self.conf["busy_factor"]), 2)
@@ -1,7 +1,19 @@
 __all__ = [
     "Funda",
+    "GenericSource",
+    "SOURCES",
     "Source",
 ]
 
+from huizenjacht.utils.registry import Registry
 from .source_intf import Source
-from .funda import Funda
\ No newline at end of file
+
+# Available sources by config key, a source module is imported once the source is used
+SOURCES = Registry(__name__, {
+    "funda": ".funda:Funda",
+    "generic": ".generic:GenericSource",
+})
+
+
+def __getattr__(name: str):
+    return SOURCES.get_by_class_name(name)
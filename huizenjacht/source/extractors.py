@@ -0,0 +1,149 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from typing import Any
+
+from huizenjacht.utils.ld_json import iter_ld_json
+
+
+class Extractor(ABC):
+    """
+    Finds the values of interest, usually listing links, in a result page.
+    Extractors are compiled from a spec once, when their source is loaded, and can then be applied to any number of
+    pages. Use compile_extractor() to build one from a config entry.
+    """
+
+    """Return the values found in a page, in the order they appear"""
+    @abstractmethod
+    def __call__(self, page: str) -> list[str]:
+        pass
+
+
+class JsonLdExtractor(Extractor):
+    """
+    Follows a path through every ld+json block of a page
+    A path consists of keys separated by dots, [n] selects an element of a list and * or [*] every element of a list
+    or every value of an object, e.g. itemListElement[*].url. Blocks holding a list are searched element by element.
+    """
+
+    # Constants
+    _TOKEN = re.compile(r'\.?(?:([^.\[\]*]+)|\*|\[(\*|-?\d+)\])')
+
+    # Public attributes
+    path: str
+
+    # Private attributes
+    _tokens: list[str | int | None]  # Key, index, or None for every element
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tokens = []
+        pos = 0
+        while pos < len(path):
+            match = self._TOKEN.match(path, pos)
+            if match is None or match.end() == pos:
+                raise ValueError(f"Invalid JSON-LD path '{path}' at position {pos}")
+            key, index = match.groups()
+            if key is not None:
+                self._tokens.append(key)
+            elif index is None or index == "*":
+                self._tokens.append(None)
+            else:
+                self._tokens.append(int(index))
+            pos = match.end()
+
+    def __call__(self, page: str) -> list[str]:
+        values = []
+        for block in iter_ld_json(page):
+            try:
+                data = json.loads(block)
+            except json.JSONDecodeError:
+                continue
+            for item in data if isinstance(data, list) else [data]:
+                values += [v for v in self._walk(item, 0) if isinstance(v, str)]
+        return values
+
+    def _walk(self, node: Any, depth: int) -> Iterator[Any]:
+        if depth == len(self._tokens):
+            yield node
+            return
+
+        token = self._tokens[depth]
+        if token is None:
+            children = node if isinstance(node, list) else node.values() if isinstance(node, dict) else []
+            for child in children:
+                yield from self._walk(child, depth + 1)
+        elif isinstance(token, int):
+            if isinstance(node, list) and -len(node) <= token < len(node):
+                yield from self._walk(node[token], depth + 1)
+        elif isinstance(node, dict) and token in node:
+            yield from self._walk(node[token], depth + 1)
+
+
+class CssExtractor(Extractor):
+    """Selects elements with a CSS selector and takes an attribute of each, or their text if no attribute is given"""
+
+    # Public attributes
+    selector: str
+    attribute: str | None
+
+    # Private attributes
+    _compiled: Any  # soupsieve.SoupSieve
+
+    def __init__(self, selector: str, attribute: str = None):
+        import soupsieve  # Comes with BeautifulSoup, only needed by sources that use CSS selectors
+
+        self.selector = selector
+        self.attribute = attribute
+        self._compiled = soupsieve.compile(selector)
+
+    def __call__(self, page: str) -> list[str]:
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(page, features="html.parser")
+        values = []
+        for element in self._compiled.select(soup):
+            value = element.get_text(strip=True) if self.attribute is None else element.get(self.attribute)
+            if isinstance(value, list):  # Multi-valued attributes such as class
+                value = " ".join(value)
+            if value:
+                values.append(value)
+        return values
+
+
+class RegexExtractor(Extractor):
+    """Takes the group named url of every match, or else the first group, or else the whole match"""
+
+    # Public attributes
+    pattern: re.Pattern
+
+    def __init__(self, pattern: str):
+        self.pattern = re.compile(pattern)
+
+    def __call__(self, page: str) -> list[str]:
+        if "url" in self.pattern.groupindex:
+            return [m.group("url") for m in self.pattern.finditer(page) if m.group("url")]
+        if self.pattern.groups > 0:
+            return [m.group(1) for m in self.pattern.finditer(page) if m.group(1)]
+        return [m.group(0) for m in self.pattern.finditer(page)]
+
+
+def compile_extractor(spec: dict | str) -> Extractor:
+    """
+    Build an extractor from a config entry
+    The entry has exactly one of the keys jsonld (a path), css (a selector, optionally with an attribute) or regex
+    (a pattern). A plain string is taken to be a JSON-LD path.
+    """
+    if isinstance(spec, str):
+        return JsonLdExtractor(spec)
+
+    kinds = [kind for kind in ("jsonld", "css", "regex") if kind in spec]
+    if len(kinds) != 1:
+        raise ValueError(f"Extraction spec must have exactly one of the keys jsonld, css or regex, got {list(spec)}")
+
+    if kinds[0] == "jsonld":
+        return JsonLdExtractor(spec["jsonld"])
+    if kinds[0] == "css":
+        return CssExtractor(spec["css"], spec.get("attribute"))
+    return RegexExtractor(spec["regex"])
@@ -1,32 +1,33 @@
+import hashlib
 import json
 import logging
-import requests
+import re
 import sqlite3
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
+from collections.abc import Iterator
+from urllib.parse import urljoin, urlsplit
 
 from huizenjacht.source import Source
 from huizenjacht.config import Config
+from huizenjacht.fetch import Fetcher
+from huizenjacht.metrics import Metrics
+from huizenjacht.store import SeenStore
+from huizenjacht.utils.user_agents import UserAgentPool
+from huizenjacht.utils.ld_json import LdJsonExtractor, extract_ld_json, iter_ld_json
 
 class Funda(Source):
 
     # Constants
     BASE_URL = "https://www.funda.nl/zoeken/"
-    _allowed_property_types = {
-        "woonhuis": "house",
-        "house": "house",
-        "appartement": "apartment",
-        "apartment": "apartment",
-        "parkeergelegenheid": "parking",
-        "parking": "parking",
-    }
-    _db_table_create_stmt = '''
-CREATE TABLE IF NOT EXISTS "Funda" (
-	"id"	INTEGER NOT NULL UNIQUE,
-	"URL"	TEXT UNIQUE,
-	PRIMARY KEY("id" AUTOINCREMENT)
-)'''
+    DEFAULT_TIMEOUT = 30  # seconds
+    DB_TABLE = "Funda"  # Name and seen-table of the funda entry, other entries are named after their key
+    _ENERGY_LABEL = re.compile(r'[Ee]nergielabel(?:\s|<[^>]*>|[":])*([A-G]\+{0,4})(?![\w+])')
+    _LIVING_AREA = re.compile(r'(?:[Ww]oonoppervlakte|[Ww]onen)(?:\s|<[^>]*>|[":])*(\d+)\s*m(?:²|&#178;|2)')
+    _POSTCODE = re.compile(r'\b(\d{4}\s?[A-Z]{2})\b')
+    _DETAIL_URL = re.compile(r'/detail/(?:koop|huur)/([^/]+)/(huis|appartement|parkeergelegenheid)-([^/]+)/')
+    _CARD_MAX = 5000  # characters of a result card that are searched for its price and status
+    _CARD_PRICE = re.compile(r'(?:€|&(?:euro|#8364);)\s*(\d[\d.]*)')
+    _CARD_STATUS = re.compile(r'[ov](?<![a-z][ov])(?:nder bod|nder optie|er(?:kocht|huurd)(?: onder voorbehoud)?)\b')
+    _CARD_STATUS_WORDS = ("onder ", "verkocht", "verhuurd")  # Cards without any of these are not searched for a status
 
     # Public attributes
     logger: logging.Logger = logging.getLogger(__name__)
@@ -38,78 +39,269 @@ CREATE TABLE IF NOT EXISTS "Funda" (
         "area",
         "buy_or_rent",
     }
+    _name: str
     _req_url: str
     _req_url_params: dict
     _req_url_headers: dict
-    _ua: UserAgent
+    _last_url: str = None  # Full URL of the last successful request
+    _cards: dict[str, bytes | None]  # Fingerprint of the result card of every house of the current stream, by url
+    _ua: UserAgentPool
+    _fetcher: Fetcher
     _conn: sqlite3.Connection
+    _store: SeenStore
 
 
-    def __init__(self, db: sqlite3.Connection):
-        self.conf = Config().config['sources']['funda']
+    def __init__(self, db: sqlite3.Connection, name: str):
+        # Further entries of type funda, e.g. for a second area, get a name and seen-table of their own
+        if name == "funda":
+            self._name = self.DB_TABLE
+        else:
+            self._name = "".join(c for c in str(name) if c.isalnum() or c == "_")
+            self.logger = logging.getLogger(f"{__name__}.{self._name}")
+        self.conf = Config().config['sources'][name]
 
         self._sanity_check_conf()
 
         self._setup_from_conf()
 
-        self._ua = UserAgent()
+        self._ua = UserAgentPool()
+        self._fetcher = Fetcher()
+        self._cards = {}
 
         self._conn = db
         self.db = db.cursor()
 
-        self.db.execute(self._db_table_create_stmt)
-
-    def get(self) -> list[str] | None:
-        soup = self._do_request()
-
-        if soup is None:
-            return []
-
-        url_list = self._parse_response(soup)
+        self._store = SeenStore(db, self._name)
 
-        if url_list is None:
-            return []
+    @property
+    def name(self) -> str:
+        return self._name
 
-        return url_list
-
-    def _do_request(self) -> BeautifulSoup | None:
+    def get(self) -> list[str] | None:
+        return [url for page_urls in self.stream() for url in page_urls]
+
+    """Yield the houses of every result page as soon as it has been parsed"""
+    def stream(self) -> Iterator[list[str]]:
+        # Results are sorted newest first, so follow result pages until one contains a house seen before.
+        # In quiet periods this costs a single request, in busy periods up to max_pages.
+        metrics = Metrics()
+        self._cards = {}
+        full = self._start_poll()
+        for page_number in range(1, self.conf_value("max_pages", 1) + 1):
+            with metrics.timer("fetch_seconds", source=self.name):
+                page = self._do_request(page_number, conditional=not full)
+
+            if page is None:
+                break
+
+            with metrics.timer("parse_seconds", source=self.name):
+                page_urls = self._parse_response(page)
+
+            if not page_urls:
+                break
+
+            # The listings and what their cards show are compared
+            if self._page_unchanged(self._last_url, page_urls,
+                                    [[url, (self._cards.get(url) or b"").hex()] for url in page_urls]):
+                break
+
+            # Decide on the next page before handing this one out, which marks its houses as seen
+            seen_before = any(self._store.contains(url) for url in page_urls)
+            yield page_urls
+            if seen_before:
+                break
+
+    def _do_request(self, page_number: int = 1, conditional: bool = True) -> str | None:
         # Randomize User-Agent
         headers = self._req_url_headers
         headers["User-Agent"] = self._ua.random
 
-        # Do request
-        res = requests.get(
+        params = self._req_url_params
+        if page_number > 1:
+            params = params | {"search_result": page_number}
+
+        # Optionally stop downloading once the ld+json block has been received
+        stop = LdJsonExtractor().feed if self.conf_value("early_stop", False) else None
+
+        # Do request, a conditional request is answered with 304 if nothing changed since the last poll
+        res = self._fetcher.get(
             url=self._req_url,
-            params=self._req_url_params,
+            params=params,
             headers=headers,
+            timeout=self.conf_value("timeout", self.DEFAULT_TIMEOUT),
+            conditional=conditional,
+            stop=stop,
         )
+        self.last_status = res.status
+        Metrics().inc("http_responses_total", source=self.name, status=res.status or "error")
 
-        if res.status_code != 200:
-            self.logger.warning("Could not reach Funda page successfully, http status code %i", res.status_code)
+        if res.error is not None:
+            self.logger.warning("Could not reach Funda page: %s", res.error)
             return None
 
-        return BeautifulSoup(res.text, features="html.parser")
+        if res.not_modified:
+            self.logger.debug("Funda page %i not modified since last poll", page_number)
+            Metrics().inc("pages_unchanged_total", source=self.name, reason="not_modified")
+            return None
 
-    def _parse_response(self, soup: BeautifulSoup) -> list:
+        if not res.ok:
+            self.logger.warning("Could not reach Funda page successfully, http status code %i", res.status)
+            return None
+
+        self._last_url = res.url
+        return res.text
+
+    def _parse_response(self, page: str, block: str = None) -> list | None:
         try:
             # Get urls
-            urls_json = json.loads("".join(soup.find("script", {"type": "application/ld+json"}).contents[0]))
-            urls = [item["url"] for item in urls_json["itemListElement"]]
-        except AttributeError as exc:
+            urls_json = self._load_ld_json(page, block)
+            items = urls_json["itemListElement"]
+            urls = [item["url"] for item in items]
+            self._cards.update(self._card_fingerprints(page, urls))
+        except (AttributeError, IndexError, KeyError, TypeError, json.JSONDecodeError) as exc:
             self.logger.info(f"Failed to retrieve Funda urls from query with parameters {self._req_url_params}")
+            self._fetcher.forget(self._last_url)  # Make sure this page is fetched in full next time
             urls = None
 
         return urls
 
-    def is_new(self, house: str) -> bool:
-        try:
-            self.db.execute("insert into Funda (url) values (?)", [house])
-        except sqlite3.IntegrityError:
-            return False
+    """
+    Fingerprint the price and status on the result card of every house
+    The ld+json block only holds the url of every house, the card further down the page shows its price and labels
+    such as "Onder bod". A card runs from the first link to its house up to the first link to another house.
+    Returns None for a house whose card was not found, or shows neither price nor status.
+    """
+    def _card_fingerprints(self, page: str, urls: list[str]) -> dict[str, bytes | None]:
+        fingerprints = {}
+        for url in urls:
+            path = urlsplit(url).path
+            start = page.find(path)
+            while start != -1:
+                # Only a link counts, not the url in the ld+json block
+                href = page.rfind('href="', max(start - 64, 0), start)
+                if href != -1 and '"' not in page[href + 6:start]:
+                    break
+                start = page.find(path, start + 1)
+            if start == -1:
+                fingerprints[url] = None
+                continue
+
+            # The card ends where a link to another house starts
+            end = min(start + self._CARD_MAX, len(page))
+            pos = page.find("/detail/", start + len(path), end)
+            while pos != -1 and page.startswith(path, pos):
+                pos = page.find("/detail/", pos + len(path), end)
+            card = page[start:end if pos == -1 else pos]
+
+            prices = self._CARD_PRICE.findall(card)
+            card_lower = card.lower()
+            statuses = []
+            if any(word in card_lower for word in self._CARD_STATUS_WORDS):
+                statuses = self._CARD_STATUS.findall(card_lower)
+            if not prices and not statuses:
+                fingerprints[url] = None
+                continue
+            fingerprints[url] = hashlib.blake2b(json.dumps([prices, statuses]).encode(), digest_size=8).digest()
+        return fingerprints
+
+    """Load the ld+json listing block of a search page, block may be given if it was extracted already
+    The block is located by a plain text scan, a complete DOM is only built if that fails."""
+    def _load_ld_json(self, page: str, block: str = None) -> dict:
+        if block is None:
+            block = extract_ld_json(page)
+        if block is not None:
+            try:
+                return json.loads(block)
+            except json.JSONDecodeError:
+                pass
+
+        self.logger.debug("Fast ld+json extraction failed, falling back to BeautifulSoup")
+        from bs4 import BeautifulSoup  # Slow to import and rarely needed
+        soup = BeautifulSoup(page, features="html.parser")
+        return json.loads("".join(soup.find("script", {"type": "application/ld+json"}).contents[0]))
+
+    """Parse a listing page into a record, from its ld+json blocks with a plain text fallback for the fields that
+    Funda does not put in there"""
+    def parse_detail(self, page: str, url: str = None) -> dict | None:
+        record = {}
+        if url is not None and (match := self._DETAIL_URL.search(url)):
+            record["property_type"] = self.PROPERTY_TYPES.get(match[2], "house")
+        for block in iter_ld_json(page):
+            try:
+                data = json.loads(block)
+            except json.JSONDecodeError:
+                continue
+            for item in data if isinstance(data, list) else [data]:
+                if isinstance(item, dict):
+                    self._parse_detail_item(item, record)
+
+        if "energy_label" not in record and (match := self._ENERGY_LABEL.search(page)):
+            record["energy_label"] = match[1]
+        if "living_area" not in record and (match := self._LIVING_AREA.search(page)):
+            record["living_area"] = int(match[1])
+
+        return record or None
+
+    def _parse_detail_item(self, item: dict, record: dict):
+        offers = item.get("offers")
+        if isinstance(offers, list):
+            offers = offers[0] if offers else None
+        if isinstance(offers, dict) and "price" not in record:
+            try:
+                record["price"] = int(float(offers["price"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        address = item.get("address")
+        if isinstance(address, dict):
+            record.setdefault("street", address.get("streetAddress"))
+            record.setdefault("city", address.get("addressLocality"))
+            postcode = address.get("postalCode")
+            if postcode is None and (match := self._POSTCODE.search(str(item.get("name", "")))):
+                postcode = match[1]
+            record.setdefault("postcode", postcode)
+
+        floor_size = item.get("floorSize")
+        if isinstance(floor_size, dict) and "living_area" not in record:
+            try:
+                record["living_area"] = int(float(floor_size["value"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        for key in ("numberOfRooms", "numberOfBedrooms"):
+            if key in item and "rooms" not in record:
+                try:
+                    record["rooms"] = int(item[key])
+                except (TypeError, ValueError):
+                    pass
+
+        for key, value in list(record.items()):
+            if value is None:
+                del record[key]
+
+    def is_seen(self, house: str) -> bool:
+        return self._store.contains(house)
+
+    """The city and street with house number are part of the url, e.g. .../enschede/huis-hengelosestraat-12-a/..."""
+    def address(self, house: str) -> tuple[str | None, str | None, str | None] | None:
+        match = self._DETAIL_URL.search(house)
+        if match is None:
+            return None
+        return match[3].replace("-", " "), match[1].replace("-", " "), None
+
+    """Price and status on the result card, None if the card was not found"""
+    def fingerprint(self, house: str) -> bytes | None:
+        return self._cards.get(house)
 
-        self._conn.commit()
+    def is_new(self, house: str) -> bool:
+        with Metrics().timer("dedup_seconds", source=self.name):
+            return self._store.is_new(house)
 
-        return True
+    def filter_new(self, houses: list[str], commit: bool = True) -> list[str]:
+        with Metrics().timer("dedup_seconds", source=self.name):
+            new = self._store.filter_new(houses, commit=commit)
+        self._finish_poll(houses)
+        return new
 
     def _sanity_check_conf(self):
         super()
@@ -118,6 +310,9 @@ CREATE TABLE IF NOT EXISTS "Funda" (
         if not buy_or_rent in ("buy", "koop", "rent", "huur"):
             raise ValueError(f'Config entry buy_or_rent must be one of [buy, rent, koop, huur], is now "{buy_or_rent}"')
 
+        if self.conf_value("early_stop", False):
+            self.logger.warning("early_stop cuts off the result cards, changes in price or status are not detected")
+
         self.logger.info("Configuration sanity check successful")
 
     def _setup_from_conf(self):
@@ -146,9 +341,9 @@ CREATE TABLE IF NOT EXISTS "Funda" (
         # Parse property type
         property_type = self.conf_value("property_type", "woonhuis")
         try:
-            property_type = [self._allowed_property_types[prop] for prop in property_type]
+            property_type = [self.PROPERTY_TYPES[prop] for prop in property_type]
         except KeyError:
-            raise KeyError(f"Config value 'property_type' in Funda source contains an entry that is not one of {[k for k in self._allowed_property_types.keys()]}")
+            raise KeyError(f"Config value 'property_type' in Funda source contains an entry that is not one of {[k for k in self.PROPERTY_TYPES.keys()]}")
 
         # Parse other url params
         url_params["price"] = f'"{min_price}-{"" if max_price == 0 else max_price}"'
@@ -187,11 +382,12 @@ sources:
     Config().load_text(conf_text)
     conf = Config().config
     db = sqlite3.connect(conf["server"]["db"])
-    f = Funda(db)
+    f = Funda(db, "funda")
 
     houses = f.get()
+    new_houses = set(f.filter_new(houses))
 
     for h in houses:
-        print(f"{h}: {'new' if f.is_new(h) else 'old'}")
+        print(f"{h}: {'new' if h in new_houses else 'old'}")
 
     f._conn.commit()
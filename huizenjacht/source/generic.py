@@ -0,0 +1,171 @@
+import logging
+import re
+import sqlite3
+import string
+from collections.abc import Iterator
+from urllib.parse import urldefrag, urljoin
+
+from huizenjacht.source import Source
+from huizenjacht.source.extractors import Extractor, compile_extractor
+from huizenjacht.config import Config
+from huizenjacht.fetch import Fetcher
+from huizenjacht.metrics import Metrics
+from huizenjacht.store import SeenStore
+from huizenjacht.utils.user_agents import UserAgentPool
+
+
+class GenericSource(Source):
+    """
+    Source for any site that can be described in the configuration, without code of its own.
+    The entry gives a URL template, optional query parameters and an extraction spec that finds the listing links on a
+    result page. Templates may use {page} and any other value of the entry, e.g. {area}. Templates and spec are
+    compiled once when the source is loaded, pages go through the shared Fetcher and houses are deduplicated in a
+    seen-table named after the entry, so every generic source costs about as much per cycle as a dedicated one.
+    Pages are fetched with conditional requests, except for a full poll every FULL_POLL_INTERVAL seconds, and a page
+    that lists the same houses as when it was last handled is not handed out again.
+
+    sources:
+      pararius:
+        active: true
+        type: "generic"
+        url: "https://www.pararius.nl/huurwoningen/{area}/page-{page}"
+        area: "enschede"
+        max_pages: 2
+        extract:
+          css: "a.listing-search-item__link--title"
+          attribute: "href"
+        address: "/huurwoningen/(?P<city>[^/]+)/[^/]+/(?P<street>[^/]+)"
+
+    The optional address pattern is matched against the url of every house, its named groups street (with house
+    number), city and postcode are used to recognise the same house on other sources.
+    """
+
+    # Public attributes
+    logger: logging.Logger = None
+    conf: dict = None
+    db: sqlite3.Cursor
+
+    # Private attributes
+    _required_conf_entries: set = {
+        "url",
+        "extract",
+    }
+    _name: str
+    _values: dict  # Template values taken from the entry
+    _paged: bool  # Whether the templates use {page}
+    _extract: Extractor
+    _address: re.Pattern | None
+    _ua: UserAgentPool
+    _fetcher: Fetcher
+    _conn: sqlite3.Connection
+    _store: SeenStore
+
+    def __init__(self, db: sqlite3.Connection, name: str):
+        self._name = "".join(c for c in str(name) if c.isalnum() or c == "_")
+        self.logger = logging.getLogger(f"{__name__}.{self._name}")
+        self.conf = Config().config["sources"][name]
+
+        self._sanity_check_conf()
+        self._compile()
+
+        self._ua = UserAgentPool()
+        self._fetcher = Fetcher()
+
+        self._conn = db
+        self.db = db.cursor()
+        self._store = SeenStore(db, self._name)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def get(self) -> list[str] | None:
+        return [url for page_urls in self.stream() for url in page_urls]
+
+    """Yield the houses of every result page, following pages until one contains a house seen before"""
+    def stream(self) -> Iterator[list[str]]:
+        metrics = Metrics()
+        first_page = self.conf_value("first_page", 1)
+        last_page = first_page + (self.conf_value("max_pages", 1) if self._paged else 1)
+        full = self._start_poll()
+        for page_number in range(first_page, last_page):
+            with metrics.timer("fetch_seconds", source=self.name):
+                res = self._do_request(page_number, conditional=not full)
+            if res is None:
+                break
+
+            with metrics.timer("parse_seconds", source=self.name):
+                page_urls = self._parse_response(res.text, res.url)
+            if not page_urls:
+                self.logger.info(f"No houses found on page {page_number} of {res.url}")
+                break
+            if self._page_unchanged(res.url, page_urls):
+                break
+
+            seen_before = any(self._store.contains(url) for url in page_urls)
+            yield page_urls
+            if seen_before:
+                break
+
+    def _do_request(self, page_number: int, conditional: bool = True):
+        values = self._values | {"page": page_number}
+        res = self._fetcher.get(
+            url=self.conf["url"].format_map(values),
+            params={k: str(v).format_map(values) for k, v in self.conf_value("params", {}).items()},
+            headers=self.conf_value("headers", {}) | {"User-Agent": self._ua.random},
+            timeout=self.conf_value("timeout"),
+            conditional=conditional,
+        )
+        self.last_status = res.status
+        Metrics().inc("http_responses_total", source=self.name, status=res.status or "error")
+
+        if res.error is not None:
+            self.logger.warning(f"Could not reach {self.name} page: {res.error}")
+            return None
+        if res.not_modified:
+            Metrics().inc("pages_unchanged_total", source=self.name, reason="not_modified")
+            return None
+        if not res.ok:
+            self.logger.warning(f"Could not reach {self.name} page successfully, http status code {res.status}")
+            return None
+        return res
+
+    """Extract the listing urls of a result page, made absolute and without duplicates"""
+    def _parse_response(self, page: str, page_url: str) -> list[str]:
+        base_url = self.conf_value("base_url", page_url)
+        urls = (urldefrag(urljoin(base_url, value.strip())).url for value in self._extract(page))
+        return list(dict.fromkeys(urls))
+
+    def address(self, house: str) -> tuple[str | None, str | None, str | None] | None:
+        match = self._address.search(house) if self._address is not None else None
+        if match is None:
+            return None
+        groups = match.groupdict()
+        return tuple(groups.get(part) and groups[part].replace("-", " ") for part in ("street", "city", "postcode"))
+
+    def is_seen(self, house: str) -> bool:
+        return self._store.contains(house)
+
+    def is_new(self, house: str) -> bool:
+        with Metrics().timer("dedup_seconds", source=self.name):
+            return self._store.is_new(house)
+
+    def filter_new(self, houses: list[str], commit: bool = True) -> list[str]:
+        with Metrics().timer("dedup_seconds", source=self.name):
+            new = self._store.filter_new(houses, commit=commit)
+        self._finish_poll(houses)
+        return new
+
+    """Compile the extraction spec and check that the templates only use known values"""
+    def _compile(self):
+        self._extract = compile_extractor(self.conf["extract"])
+        self._address = re.compile(self.conf["address"]) if self.conf.get("address") else None
+
+        self._values = {k: v for k, v in self.conf.items() if isinstance(v, (str, int, float))}
+        templates = [self.conf["url"], *map(str, self.conf_value("params", {}).values())]
+        fields = {field.split(".")[0].split("[")[0] for template in templates
+                  for _, field, _, _ in string.Formatter().parse(template) if field}
+        missing = fields - set(self._values) - {"page"}
+        if missing:
+            raise KeyError(f"Source {self.name} uses {sorted(missing)} in its url or params, but does not define them")
+        self._paged = "page" in fields
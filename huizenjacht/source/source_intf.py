@@ -1,13 +1,48 @@
+import hashlib
+import json
 import logging
+from collections.abc import Iterator
 from typing import Any
 from abc import ABC, abstractmethod
 
+from huizenjacht.metrics import Metrics
+from huizenjacht.utils.clock import Clock
+
 
 class Source(ABC):
     """
     Interface for information sources.
     """
 
+    # Property types as they may be configured, by Funda or in English, and the type they stand for in records
+    PROPERTY_TYPES = {
+        "woonhuis": "house",
+        "house": "house",
+        "appartement": "apartment",
+        "apartment": "apartment",
+        "parkeergelegenheid": "parking",
+        "parking": "parking",
+    }
+
+    # HTTP status code of the most recent poll, None if no response was received
+    last_status: int | None = None
+
+    # Seconds after which a poll fetches its pages in full, even if the site answers that they did not change, so that
+    # the houses on a page that never changes are still marked as seen and not pruned
+    FULL_POLL_INTERVAL = 24 * 3600
+    _last_full_poll: float = 0
+    _pending_full_poll: float | None = None
+
+    # Digest of what every result page listed when its houses were last handled, by full URL, and the digest and first
+    # house of the pages of the current poll
+    _page_digests: dict[str, bytes] | None = None
+    _pending_digests: dict[str, tuple[bytes, Any]] | None = None
+
+    # Name of the source in logs, metrics and database tables, unique among the loaded sources
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
     # Public attributes
     @property
     @abstractmethod
@@ -36,6 +71,15 @@ class Source(ABC):
     def get(self):
         pass
 
+    """
+    Get the available houses as a stream of batches, e.g. one per result page, so that they can be handled before the
+    rest has been fetched. Sources that fetch in several steps should override this, and implement get() on top of it
+    """
+    def stream(self) -> Iterator[list]:
+        houses = self.get()
+        if houses:
+            yield houses
+
     """
     Add house to database and check whether the provided house is newly found
     """
@@ -43,6 +87,90 @@ class Source(ABC):
     def is_new(self, house: Any) -> bool:
         pass
 
+    """
+    Add multiple houses to database at once and return the ones that are newly found
+    Sources backed by a database should override this with a single batched transaction, that is left open for the
+    caller to commit if commit is False
+    """
+    def filter_new(self, houses: list, commit: bool = True) -> list:
+        return [house for house in houses if self.is_new(house)]
+
+    """
+    Check whether a house has been seen before, without adding it to the database
+    Used to select the houses worth enriching before they are deduplicated
+    """
+    def is_seen(self, house: Any) -> bool:
+        return False
+
+    """
+    Return a compact fingerprint of what the source showed of a house in its last result, which changes when the
+    listing changes, e.g. in price or status. Returns None if the source does not know anything beyond the house itself.
+    """
+    def fingerprint(self, house: Any) -> bytes | None:
+        return None
+
+    """
+    Return the address of a house as far as the source knows it without fetching its detail page, as a
+    (street with house number, city, postcode) tuple with None for unknown parts, or None if nothing is known
+    Used to recognise the same house on several sources.
+    """
+    def address(self, house: Any) -> tuple[str | None, str | None, str | None] | None:
+        return None
+
+    """
+    Parse the detail page of a house into a record of its properties
+    Returns None for sources without detail page support, or when nothing could be parsed. Known keys are street,
+    postcode, city, price, living_area, rooms, energy_label and property_type (house, apartment or parking), sources
+    fill in what they can.
+    """
+    def parse_detail(self, page: str, url: str = None) -> dict | None:
+        return None
+
+    """
+    Start a poll and return whether it is a full one, in which pages are fetched and handled even if unchanged
+    Sources that send conditional requests call this at the start of stream(), and _finish_poll() once the houses
+    have been handled, so that a full poll whose houses were dropped is repeated. In between, _page_unchanged() skips
+    result pages that list the same as before.
+    """
+    def _start_poll(self) -> bool:
+        now = Clock().time()
+        full = now - self._last_full_poll >= self.FULL_POLL_INTERVAL
+        self._pending_full_poll = now if full else None
+        if self._page_digests is None:
+            self._page_digests = {}
+        self._pending_digests = {}
+        return full
+
+    """
+    Check whether a result page lists the same as when its houses were last handled, outside a full poll
+    Pages often change in ways that do not matter, e.g. tracking ids, so only the houses are compared, or listing if
+    given, which should be JSON serializable and hold whatever else of the houses the source compares, e.g. prices.
+    """
+    def _page_unchanged(self, page_url: str, houses: list, listing: Any = None) -> bool:
+        digest = hashlib.blake2b(json.dumps(houses if listing is None else listing).encode(), digest_size=16).digest()
+        if self._pending_full_poll is None and self._page_digests.get(page_url) == digest:
+            self.logger.debug(f"Page {page_url} unchanged since last poll")
+            Metrics().inc("pages_unchanged_total", source=self.name, reason="same_content")
+            return True
+
+        self._pending_digests[page_url] = (digest, houses[0])
+        return False
+
+    """
+    Record that the given houses of the current poll have been handled
+    The pages they were listed on can be skipped from now on while unchanged, a page that was dropped is parsed again.
+    """
+    def _finish_poll(self, houses: list):
+        if self._pending_digests:
+            handled = set(houses)
+            for page_url, (digest, first_house) in list(self._pending_digests.items()):
+                if first_house in handled:
+                    self._page_digests[page_url] = digest
+                    del self._pending_digests[page_url]
+        if self._pending_full_poll is not None:
+            self._last_full_poll = self._pending_full_poll
+            self._pending_full_poll = None
+
     """
     Get a value from the config
     """
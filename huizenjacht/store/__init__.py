@@ -0,0 +1,20 @@
+__all__ = [
+    "AddressIndex",
+    "BloomFilter",
+    "Compactor",
+    "ListingHistory",
+    "Outbox",
+    "SeenIndex",
+    "SeenStore",
+    "attach_shared",
+    "connect",
+    "listing_key",
+]
+
+from .outbox import Outbox
+from .seen_index import SeenIndex, BloomFilter
+from .seen_store import SeenStore, listing_key
+from .database import attach_shared, connect
+from .compactor import Compactor
+from .history import ListingHistory
+from .address_index import AddressIndex
@@ -0,0 +1,221 @@
+import logging
+import sqlite3
+import threading
+import weakref
+
+from huizenjacht.config import Config
+from huizenjacht.store.seen_store import SHARED_SCHEMA, shared_schema
+from huizenjacht.utils.address import address_keys, ngrams
+from huizenjacht.utils.clock import Clock
+
+
+class AddressIndex:
+    """
+    Cross-source identity of houses, keyed on their normalized address.
+    A house is known by its postcode and house number, and by its city, street and house number, whichever its source
+    provides. Every key is kept in a dictionary, so an exact match costs a lookup per key. Spelling differences between
+    sites, such as abbreviated street names, are caught by a trigram index of street names. Its posting lists are
+    split per city and house number, so a fuzzy lookup only compares the few streets that share both.
+    A house that matches an address seen on any source within the last window seconds is a duplicate.
+    In a cluster, the table lives in the shared database and the addresses other nodes have written since the last
+    batch are loaded before every batch is matched. Addresses that were last seen before the window are evicted and
+    deleted from the table by the Compactor.
+    """
+
+    # Constants
+    DB_TABLE = "Addresses"
+    SYNC_SLACK = 300  # seconds, addresses are loaded again this long after they were written, to cover clock skew
+
+    _db_table_create_stmt = '''
+CREATE TABLE IF NOT EXISTS "{schema}"."Addresses" (
+	"id"	TEXT NOT NULL,
+	"source"	TEXT NOT NULL,
+	"URL"	TEXT,
+	"last_seen"	INTEGER NOT NULL,
+	PRIMARY KEY("id")
+) WITHOUT ROWID'''
+    _db_index_create_stmt = 'CREATE INDEX IF NOT EXISTS "{schema}"."Addresses_last_seen" ON "Addresses" ("last_seen")'
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+    schema: str
+    db: sqlite3.Cursor
+
+    # Private attributes
+    _conn: sqlite3.Connection
+    _keys: dict[str, list]  # [source, url, last_seen] per key
+    _grams: dict[str, set[str]]  # Street keys per block and trigram
+    _gram_counts: dict[str, int]  # Number of trigrams per street key
+    _synced: float  # Time up to which the addresses in the table have been loaded
+    _lock: threading.Lock
+    _instances: weakref.WeakSet = weakref.WeakSet()  # All indexes, to evict expired addresses during compaction
+    _instances_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, db: sqlite3.Connection):
+        self.logger = logging.getLogger(__name__)
+        self.conf = {
+            "active": True,
+            "window": 30 * 24 * 3600,  # seconds, a house listed again after this long is new
+            "similarity": 0.8,  # minimum Dice coefficient of the trigrams of two street names that match
+        } | (Config().config["server"].get("duplicates") or {})
+
+        self.schema = shared_schema(db)
+        self._conn = db
+        self.db = db.cursor()
+        self._keys = {}
+        self._grams = {}
+        self._gram_counts = {}
+        self._lock = threading.Lock()
+
+        self.db.execute(self._db_table_create_stmt.format(schema=self.schema))
+        self.db.execute(self._db_index_create_stmt.format(schema=self.schema))
+        self._conn.commit()
+        self._warm()
+        with self._instances_lock:
+            self._instances.add(self)
+
+    @property
+    def active(self) -> bool:
+        return self.conf["active"]
+
+    """Quoted name of the table, qualified by its schema"""
+    @property
+    def table_ref(self) -> str:
+        return f'"{self.schema}"."{self.DB_TABLE}"'
+
+    """All address indexes that are alive"""
+    @classmethod
+    def indexes(cls) -> list["AddressIndex"]:
+        with cls._instances_lock:
+            return list(cls._instances)
+
+    """Load all addresses seen within the window"""
+    def _warm(self):
+        now = Clock().time()
+        self._load(now - self.conf["window"])
+        self._synced = now
+        self.logger.debug(f"Loaded {len(self._keys)} addresses")
+
+    """Load the addresses that were written since time t, taking over the first sighting recorded in the table"""
+    def _load(self, t: float):
+        for key, source, url, last_seen in self.db.execute(
+                f'SELECT id, source, URL, last_seen FROM "{self.schema}"."{self.DB_TABLE}" WHERE last_seen >= ?',
+                [int(t)]):
+            known = self._keys.get(key)
+            if known is None:
+                self._add(key, source, url, last_seen)
+            elif last_seen >= known[2]:
+                known[:] = [source, url, last_seen]
+
+    def _add(self, key: str, source: str, url: str | None, last_seen: int):
+        known = self._keys.get(key)
+        if known is not None:
+            known[2] = last_seen
+            return
+
+        self._keys[key] = [source, url, last_seen]
+        if key.startswith("st:"):
+            block, name = key.rsplit("|", 1)
+            grams = ngrams(name)
+            self._gram_counts[key] = len(grams)
+            for gram in grams:
+                self._grams.setdefault(f"{block}|{gram}", set()).add(key)
+
+    def _remove(self, key: str):
+        del self._keys[key]
+        if self._gram_counts.pop(key, None) is None:
+            return
+
+        block, name = key.rsplit("|", 1)
+        for gram in ngrams(name):
+            gram_key = f"{block}|{gram}"
+            streets = self._grams.get(gram_key)
+            if streets is None:
+                continue
+            streets.discard(key)
+            if len(streets) == 0:
+                del self._grams[gram_key]
+
+    """Forget the addresses that were last seen before time t, returns their number"""
+    def evict(self, t: float) -> int:
+        with self._lock:
+            expired = [key for key, known in self._keys.items() if known[2] < t]
+            for key in expired:
+                self._remove(key)
+        if len(expired) > 0:
+            self.logger.debug(f"Evicted {len(expired)} addresses, {len(self._keys)} remain")
+        return len(expired)
+
+    """Return the first sighting (source, url) of the address with the given keys, or None if it is new"""
+    def _match(self, keys: list[str], street_key: str | None, cutoff: float) -> tuple[str, str] | None:
+        for key in keys:
+            known = self._keys.get(key)
+            if known is not None and known[2] >= cutoff:
+                return known[0], known[1]
+
+        if street_key is None:
+            return None
+
+        # Fuzzy: count the trigrams shared with every street of the same city and house number
+        block, name = street_key.rsplit("|", 1)
+        grams = ngrams(name)
+        shared: dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._grams.get(f"{block}|{gram}", ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best, best_score = None, self.conf["similarity"]
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + self._gram_counts[candidate])
+            if score >= best_score and self._keys[candidate][2] >= cutoff:
+                best, best_score = candidate, score
+        return None if best is None else tuple(self._keys[best][:2])
+
+    """
+    Split houses into the ones seen first here and duplicates of a house seen on any source before
+    addresses gives (street, city, postcode) per house, houses without an address are always first. All addresses
+    are registered in the open transaction, the caller commits. Returns the first sightings in their original order,
+    and the duplicates with the (source, url) they duplicate.
+    """
+    def filter_first(self, source: str, houses: list[str], addresses: dict[str, tuple]) -> \
+            tuple[list[str], dict[str, tuple[str, str]]]:
+        now = int(Clock().time())
+        cutoff = now - self.conf["window"]
+        first, duplicates, rows = [], {}, []
+        with self._lock:
+            if self.schema == SHARED_SCHEMA:
+                # The caller claimed these houses in the open transaction, which holds the write lock of the shared
+                # database, so no other node can add an address between this load and the commit
+                self._load(self._synced - self.SYNC_SLACK)
+                self._synced = now
+
+            for house in houses:
+                keys, street_key = address_keys(*addresses[house]) if house in addresses else ([], None)
+                if not keys:
+                    first.append(house)
+                    continue
+
+                original = self._match(keys, street_key, cutoff)
+                if original is None:
+                    first.append(house)
+                    original = (source, house)
+                else:
+                    duplicates[house] = original
+
+                # Every key of this house points at the first sighting, so a later source that only knows the
+                # postcode still matches a house that was first found by street
+                for key in keys:
+                    known = self._keys.get(key)
+                    if known is not None and known[2] < cutoff:
+                        known[0], known[1] = original  # The earlier sighting has expired, this one is the first now
+                    self._add(key, original[0], original[1], now)
+                    rows.append((key, *self._keys[key][:2], now))
+
+            self.db.executemany(
+                f'INSERT INTO "{self.schema}"."{self.DB_TABLE}" (id, source, URL, last_seen) VALUES (?, ?, ?, ?) '
+                f'ON CONFLICT(id) DO UPDATE SET source = excluded.source, URL = excluded.URL, '
+                f'last_seen = excluded.last_seen',
+                rows
+            )
+        return first, duplicates
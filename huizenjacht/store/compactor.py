@@ -0,0 +1,133 @@
+import logging
+import sqlite3
+import threading
+
+from huizenjacht.config import Config
+from huizenjacht.metrics import Metrics
+from huizenjacht.store.address_index import AddressIndex
+from huizenjacht.store.seen_store import SHARED_SCHEMA, SeenStore
+from huizenjacht.utils.clock import Clock
+
+
+class Compactor(threading.Thread):
+    """
+    Background thread applying the retention policy to all seen-tables, as registered by SeenStore.
+    Houses that have not been seen for the configured number of days are deleted in small batches, each in its own
+    short transaction with a pause in between, so the poll cycle never waits long for the database. The freed pages
+    are then returned to the file system step by step with incremental_vacuum. The seen-index of a table that lost
+    houses is rebuilt, so that a house that is listed again later is recognised as new. Addresses that fell out of the
+    duplicate window are deleted from the address table and evicted from every AddressIndex, whether or not a retention
+    period is configured.
+    The thread needs a connection of its own. The tables of an attached cluster database are compacted as well, every
+    node does so, which is harmless since deleting a row twice is a no-op.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+
+    # Private attributes
+    _conn: sqlite3.Connection
+    _stopping: threading.Event
+
+    def __init__(self, db: sqlite3.Connection):
+        super().__init__(name="compactor", daemon=True)
+        self.logger = logging.getLogger(__name__)
+
+        self.conf = {
+            "days": None,  # houses not seen for this many days are forgotten, None keeps everything
+            "interval": 3600,  # seconds between compaction passes
+            "batch": 500,  # rows deleted per transaction
+            "vacuum_pages": 100,  # pages returned to the file system per step
+            "pause": 0.05,  # seconds between two batches or steps
+        } | (Config().config["server"].get("retention") or {})
+
+        self._conn = db
+        self._stopping = threading.Event()
+
+    def stop(self, timeout: float = None):
+        self._stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        while not self._stopping.wait(self.conf["interval"]):
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Compaction failed: {e}")
+
+    """Run a single compaction pass, returns the number of deleted houses"""
+    def compact(self, now: float = None) -> int:
+        now = Clock().time() if now is None else now
+        deleted = 0
+        if self.conf["days"] is not None:
+            cutoff = int(now - self.conf["days"] * 24 * 3600)
+            for table in self.seen_tables():
+                pruned = self._prune(table, cutoff)
+                # Other nodes of a cluster may have pruned a shared table, so those are always reindexed
+                if pruned > 0 or table.startswith(f'"{SHARED_SCHEMA}".'):
+                    SeenStore.reindex(table, self._conn)
+                deleted += pruned
+        self._expire_addresses(now)
+        self._vacuum()
+
+        if deleted > 0:
+            self.logger.info(f"Forgot {deleted} houses that were not seen for {self.conf['days']} days")
+        Metrics().inc("compacted_rows_total", deleted)
+        return deleted
+
+    """Delete the addresses that can no longer match a duplicate, from the table and from the indexes"""
+    def _expire_addresses(self, now: float):
+        for index in AddressIndex.indexes():
+            cutoff = int(now - index.conf["window"])
+            expired = 0
+            if self._conn.execute(f'SELECT 1 FROM "{index.schema}".sqlite_master WHERE type = ? AND name = ?',
+                                  ["table", AddressIndex.DB_TABLE]).fetchone() is not None:
+                expired = self._prune(index.table_ref, cutoff)
+            index.evict(cutoff)
+            if expired > 0:
+                self.logger.debug(f"Deleted {expired} addresses that were not seen within the duplicate window")
+
+    """Names of all seen-tables, qualified by their schema"""
+    def seen_tables(self) -> list[str]:
+        tables = []
+        for schema in self._schemas():
+            registry = self._conn.execute(f'SELECT 1 FROM "{schema}".sqlite_master WHERE type = ? AND name = ?',
+                                          ["table", SeenStore.REGISTRY_TABLE]).fetchone()
+            if registry is None:
+                continue
+            tables += [f'"{schema}"."{name}"' for (name,) in self._conn.execute(
+                f'SELECT r.name FROM "{schema}"."{SeenStore.REGISTRY_TABLE}" r '
+                f'JOIN "{schema}".sqlite_master m ON m.type = ? AND m.name = r.name', ["table"]
+            )]
+        return tables
+
+    def _schemas(self) -> list[str]:
+        return [name for _, name, _ in self._conn.execute("PRAGMA database_list") if name != "temp"]
+
+    def _prune(self, table: str, cutoff: int) -> int:
+        deleted = 0
+        while not self._stopping.is_set():
+            cur = self._conn.execute(
+                f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE last_seen < ? LIMIT ?)',
+                [cutoff, self.conf["batch"]]
+            )
+            self._conn.commit()
+            deleted += cur.rowcount
+            if cur.rowcount < self.conf["batch"]:
+                break
+            self._pause()
+        return deleted
+
+    def _vacuum(self):
+        for schema in self._schemas():
+            while not self._stopping.is_set() and \
+                    self._conn.execute(f'PRAGMA "{schema}".freelist_count').fetchone()[0] > 0:
+                self._conn.execute(f'PRAGMA "{schema}".incremental_vacuum({int(self.conf["vacuum_pages"])})').fetchall()
+                self._pause()
+
+    """Give the poll cycle room to use the database, there is no concurrent cycle to wait for on a simulated clock"""
+    def _pause(self):
+        if not Clock().simulated:
+            self._stopping.wait(self.conf["pause"])
@@ -0,0 +1,135 @@
+import logging
+import sqlite3
+import time
+
+from huizenjacht.store.seen_store import SHARED_SCHEMA, SeenStore, listing_key
+
+logger = logging.getLogger(__name__)
+
+
+def connect(path: str, cache_kib: int = 2048, journal_mode: str = "WAL") -> sqlite3.Connection:
+    """
+    Open the database, tune it and bring its schema up to date
+    The database runs in WAL mode, so that readers never block the writer. With WAL, synchronous=NORMAL only syncs at
+    checkpoints, which is still safe against corruption and saves an fsync on every commit. WAL needs all processes
+    that use the database to run on the same host, a database on a network file system needs journal_mode DELETE.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+
+    # Space freed by pruning is returned in small steps by incremental_vacuum, existing databases need a one-off VACUUM
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        if conn.execute("PRAGMA page_count").fetchone()[0] > 0:
+            logger.info("Converting database to incremental auto-vacuum, this may take a while")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    migrate(conn)
+    return conn
+
+
+# Journal modes in which SQLite commits a transaction on attached databases atomically across all of them
+ROLLBACK_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST")
+
+
+def attach_shared(conn: sqlite3.Connection, path: str, journal_mode: str = "DELETE"):
+    """
+    Attach the database that the nodes of a cluster share, seen-tables created afterwards are kept there
+    SQLite only commits a transaction atomically across attached databases if none of them is in WAL mode, so both
+    databases are switched to journal_mode, which must be a rollback journal. A house is then claimed in the same
+    transaction that queues its notification, even if the daemon crashes halfway through the commit. All other
+    connections to the local database have to be opened with the same journal_mode.
+    """
+    if journal_mode.upper() not in ROLLBACK_JOURNAL_MODES:
+        raise ValueError(f"A shared database needs journal_mode {', '.join(ROLLBACK_JOURNAL_MODES)}, "
+                         f"is now {journal_mode}")
+
+    connect(path, journal_mode=journal_mode).close()  # Prepares the file like any other database
+    conn.execute(f'ATTACH DATABASE ? AS "{SHARED_SCHEMA}"', [path])
+    for schema in ("main", SHARED_SCHEMA):
+        mode = conn.execute(f'PRAGMA "{schema}".journal_mode={journal_mode}').fetchone()[0]
+        if mode.upper() not in ROLLBACK_JOURNAL_MODES and mode != "memory":
+            raise sqlite3.OperationalError(f"Could not switch {schema} database to journal_mode {journal_mode}, "
+                                           f"it is still {mode}")
+        # Without WAL, synchronous=NORMAL is no longer safe against power loss
+        conn.execute(f'PRAGMA "{schema}".synchronous=FULL')
+
+
+def _migrate_seen_tables_to_listing_ids(conn: sqlite3.Connection):
+    """
+    Version 1: seen-tables are keyed on the listing id
+    Converts tables of the form (id INTEGER AUTOINCREMENT, URL TEXT UNIQUE) into (id = listing key, URL) WITHOUT ROWID
+    tables.
+    """
+    tables = [name for (name, sql) in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'")
+              if "AUTOINCREMENT" in sql
+              and [col[1] for col in conn.execute(f'PRAGMA table_info("{name}")')] == ["id", "URL"]]
+
+    conn.create_function("listing_key", 1, listing_key, deterministic=True)
+    for table in tables:
+        logger.info(f"Converting table {table} to listing id keys")
+        conn.execute(f'CREATE TABLE "{table}_v1" ("id" INTEGER NOT NULL, "URL" TEXT, PRIMARY KEY("id")) WITHOUT ROWID')
+        conn.execute(f'INSERT OR IGNORE INTO "{table}_v1" (id, URL) '
+                     f'SELECT listing_key(URL), URL FROM "{table}" WHERE URL IS NOT NULL ORDER BY id')
+        conn.execute(f'DROP TABLE "{table}"')
+        conn.execute(f'ALTER TABLE "{table}_v1" RENAME TO "{table}"')
+
+
+def _migrate_seen_tables_add_timestamps(conn: sqlite3.Connection):
+    """
+    Version 2: seen-tables record when a house was first and last seen
+    Existing houses are taken to be seen right now, so they get the full retention period.
+    """
+    tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+              if [col[1] for col in conn.execute(f'PRAGMA table_info("{name}")')] == ["id", "URL"]]
+
+    now = int(time.time())
+    for table in tables:
+        logger.info(f"Adding timestamps to table {table}")
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "first_seen" INTEGER NOT NULL DEFAULT 0')
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "last_seen" INTEGER NOT NULL DEFAULT 0')
+        conn.execute(f'UPDATE "{table}" SET first_seen = ?, last_seen = ?', [now, now])
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_last_seen" ON "{table}" ("last_seen")')
+
+
+def _migrate_register_seen_tables(conn: sqlite3.Connection):
+    """
+    Version 3: seen-tables are listed in a registry
+    Other tables with a last_seen column, such as the listing history, are not seen-tables and must not be pruned.
+    """
+    tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+              if [col[1] for col in conn.execute(f'PRAGMA table_info("{name}")')] ==
+              ["id", "URL", "first_seen", "last_seen"]]
+    for table in tables:
+        SeenStore.register(conn, table)
+
+
+# Schema migrations as (version, function), applied in order to databases with a lower user_version
+MIGRATIONS = [
+    (1, _migrate_seen_tables_to_listing_ids),
+    (2, _migrate_seen_tables_add_timestamps),
+    (3, _migrate_register_seen_tables),
+]
+
+
+def migrate(conn: sqlite3.Connection):
+    """Apply all migrations the database has not seen yet, each in its own transaction"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, migration in MIGRATIONS:
+        if version >= target:
+            continue
+
+        logger.info(f"Migrating database from version {version} to {target}")
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
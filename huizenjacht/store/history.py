@@ -0,0 +1,214 @@
+import logging
+import sqlite3
+import threading
+from collections.abc import Callable, Iterable
+
+from huizenjacht.config import Config
+from huizenjacht.store.seen_store import listing_key
+from huizenjacht.utils.clock import Clock
+
+
+class ListingHistory:
+    """
+    Append-only history of the listings of every source.
+    Every listing that is seen gets a compact fingerprint from its source, which only changes when the listing itself
+    changes, e.g. its price or status. The last fingerprint of every listing is kept in a per-source state table and in
+    memory, so a sighting costs a dictionary lookup and a byte comparison. Only events are appended to the history:
+    a listing that is new, changed, relisted after it had disappeared, or delisted after it was not seen for
+    delist_after seconds. Sources only look at their newest listings, so delisting is off by default and only makes
+    sense for sources whose pages cover all listings.
+    Sightings are buffered and written once per cycle by flush(), in a single transaction.
+    """
+
+    # Constants
+    DB_TABLE = "ListingHistory"
+    STATE_TABLE_PREFIX = "Listings"
+    SWEEP_INTERVAL = 3600  # seconds between two searches for delisted listings
+
+    _db_table_create_stmt = '''
+CREATE TABLE IF NOT EXISTS "ListingHistory" (
+	"time"	INTEGER NOT NULL,
+	"source"	TEXT NOT NULL,
+	"id"	INTEGER NOT NULL,
+	"event"	TEXT NOT NULL,
+	"fingerprint"	BLOB,
+	"URL"	TEXT
+)'''
+    _db_index_create_stmts = (
+        'CREATE INDEX IF NOT EXISTS "ListingHistory_time" ON "ListingHistory" ("time")',
+        'CREATE INDEX IF NOT EXISTS "ListingHistory_listing" ON "ListingHistory" ("source", "id", "time")',
+    )
+    _state_table_create_stmt = '''
+CREATE TABLE IF NOT EXISTS "{table}" (
+	"id"	INTEGER NOT NULL,
+	"fingerprint"	BLOB,
+	"first_seen"	INTEGER NOT NULL,
+	"last_seen"	INTEGER NOT NULL,
+	"delisted"	INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY("id")
+) WITHOUT ROWID'''
+    _state_index_create_stmt = 'CREATE INDEX IF NOT EXISTS "{table}_last_seen" ON "{table}" ("last_seen")'
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+    db: sqlite3.Cursor
+
+    # Private attributes
+    _conn: sqlite3.Connection
+    _key: Callable[[str], int]
+    _state: dict[str, dict[int, list]]  # [fingerprint, last_seen, delisted] per listing key, per source
+    _pending: dict[str, dict[int, tuple[str, bytes | None]]]  # (url, fingerprint) per listing key, per source
+    _touch_interval: float  # seconds
+    _last_sweep: float
+    _lock: threading.Lock
+
+    def __init__(self, db: sqlite3.Connection, key: Callable[[str], int] = listing_key):
+        self.logger = logging.getLogger(__name__)
+
+        server_conf = Config().config["server"]
+        self.conf = {
+            "active": True,
+            "delist_after": None,  # seconds, listings not seen for this long are taken to be delisted
+        } | (server_conf.get("history") or {})
+        self._touch_interval = (server_conf.get("retention") or {}).get("touch_interval", 24 * 3600)
+
+        self._conn = db
+        self.db = db.cursor()
+        self._key = key
+        self._state = {}
+        self._pending = {}
+        self._last_sweep = 0
+        self._lock = threading.Lock()
+
+        self.db.execute(self._db_table_create_stmt)
+        for stmt in self._db_index_create_stmts:
+            self.db.execute(stmt)
+        self._conn.commit()
+
+    @property
+    def active(self) -> bool:
+        return self.conf["active"]
+
+    """Buffer a sighting of houses on source, given the fingerprint function of the source"""
+    def observe(self, source: str, houses: Iterable[str], fingerprint: Callable[[str], bytes | None]):
+        with self._lock:
+            pending = self._pending.setdefault(source, {})
+            for house in houses:
+                pending[self._key(house)] = (house, fingerprint(house))
+
+    """
+    Compare all buffered sightings against the last known state, write the differences and commit
+    Returns the events as (time, source, url, event) tuples.
+    """
+    def flush(self, now: float = None) -> list[tuple]:
+        now = int(Clock().time() if now is None else now)
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        events = []
+        for source, sightings in pending.items():
+            events += self._flush_source(source, sightings, now)
+        if self.conf["delist_after"] is not None and now - self._last_sweep >= self.SWEEP_INTERVAL:
+            events += self._sweep(now)
+            self._last_sweep = now
+
+        self._conn.commit()
+        return events
+
+    def _flush_source(self, source: str, sightings: dict[int, tuple[str, bytes | None]], now: int) -> list[tuple]:
+        state = self._load_state(source)
+        events = []
+        upserts = []
+        for key, (url, fingerprint) in sightings.items():
+            known = state.get(key)
+            if known is None:
+                event = "new"
+            elif known[2]:
+                event = "relisted"
+            elif fingerprint is not None and fingerprint != known[0]:
+                event = "changed"
+            elif now - known[1] >= self._touch_interval:
+                event = None  # Unchanged, only its last seen time is refreshed
+            else:
+                continue
+
+            if event is not None:
+                events.append((now, source, key, event, fingerprint, url))
+            if fingerprint is None and known is not None:
+                fingerprint = known[0]
+            state[key] = [fingerprint, now, 0]
+            upserts.append((key, fingerprint, now, now))
+
+        self.db.executemany(
+            f'INSERT INTO "{self._state_table(source)}" (id, fingerprint, first_seen, last_seen) VALUES (?, ?, ?, ?) '
+            f'ON CONFLICT(id) DO UPDATE SET fingerprint = excluded.fingerprint, last_seen = excluded.last_seen, '
+            f'delisted = 0',
+            upserts
+        )
+        self._append(events)
+        return [(t, s, url, event) for t, s, _, event, _, url in events]
+
+    """Mark listings that have not been seen for delist_after seconds as delisted"""
+    def _sweep(self, now: int) -> list[tuple]:
+        cutoff = now - self.conf["delist_after"]
+        events = []
+        for source in self.sources():
+            table = self._state_table(source)
+            keys = [key for (key,) in self.db.execute(
+                f'SELECT id FROM "{table}" WHERE last_seen < ? AND delisted = 0', [cutoff]
+            )]
+            if not keys:
+                continue
+            self.db.executemany(f'UPDATE "{table}" SET delisted = 1 WHERE id = ?', [[key] for key in keys])
+            state = self._state.get(source, {})
+            for key in keys:
+                if key in state:
+                    state[key][2] = 1
+            events += [(now, source, key, "delisted", None, None) for key in keys]
+
+        self._append(events)
+        return [(t, s, url, event) for t, s, _, event, _, url in events]
+
+    def _append(self, events: list[tuple]):
+        if events:
+            self.db.executemany(
+                f'INSERT INTO "{self.DB_TABLE}" (time, source, id, event, fingerprint, URL) VALUES (?, ?, ?, ?, ?, ?)',
+                events
+            )
+
+    """Return all events since time t, oldest first, as (time, source, id, event, url) rows
+    The url of a delisting is the one the listing was last recorded with."""
+    def changes_since(self, t: float, source: str = None) -> list[tuple]:
+        query = f'''
+SELECT h.time, h.source, h.id, h.event, COALESCE(h.URL, (
+    SELECT URL FROM "{self.DB_TABLE}" p
+    WHERE p.source = h.source AND p.id = h.id AND p.URL IS NOT NULL ORDER BY p.time DESC LIMIT 1
+))
+FROM "{self.DB_TABLE}" h WHERE h.time >= ?'''
+        params = [int(t)]
+        if source is not None:
+            query += " AND h.source = ?"
+            params.append(source)
+        return self._conn.execute(query + " ORDER BY h.time, h.rowid", params).fetchall()
+
+    """Names of all sources that have a state table"""
+    def sources(self) -> list[str]:
+        prefix = f"{self.STATE_TABLE_PREFIX}_"
+        return [name[len(prefix):] for (name,) in self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", [f"{prefix}%"]
+        )]
+
+    def _state_table(self, source: str) -> str:
+        return f"{self.STATE_TABLE_PREFIX}_{source}"
+
+    """Load the state of all listings of a source into memory, creating its table if needed"""
+    def _load_state(self, source: str) -> dict[int, list]:
+        if source not in self._state:
+            table = self._state_table(source)
+            self.db.execute(self._state_table_create_stmt.format(table=table))
+            self.db.execute(self._state_index_create_stmt.format(table=table))
+            self._state[source] = {key: [fingerprint, last_seen, delisted] for key, fingerprint, last_seen, delisted
+                                   in self.db.execute(f'SELECT id, fingerprint, last_seen, delisted FROM "{table}"')}
+            self.logger.debug(f"Loaded {len(self._state[source])} listings of {source} into the history")
+        return self._state[source]
@@ -0,0 +1,90 @@
+import logging
+import sqlite3
+import threading
+
+from huizenjacht.utils.clock import Clock
+
+
+class Outbox:
+    """
+    Database table of notifications that still have to be delivered.
+    Notifications are enqueued in the same transaction as the houses they announce, and removed once delivered,
+    so that a failing or slow comm never loses a notification.
+    """
+
+    # Constants
+    DB_TABLE = "Outbox"
+    _db_table_create_stmt = '''
+CREATE TABLE IF NOT EXISTS "Outbox" (
+	"id"	INTEGER NOT NULL UNIQUE,
+	"comm"	TEXT NOT NULL,
+	"title"	TEXT,
+	"msg"	TEXT NOT NULL,
+	"url"	TEXT,
+	"created"	REAL NOT NULL,
+	"attempts"	INTEGER NOT NULL DEFAULT 0,
+	"next_attempt"	REAL NOT NULL,
+	"last_error"	TEXT,
+	PRIMARY KEY("id" AUTOINCREMENT)
+)'''
+
+    # Public attributes
+    logger: logging.Logger
+    db: sqlite3.Cursor
+
+    # Private attributes
+    _conn: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, db: sqlite3.Connection):
+        self.logger = logging.getLogger(__name__)
+
+        self._conn = db
+        self.db = db.cursor()
+        self._lock = threading.Lock()
+
+        self.db.execute(self._db_table_create_stmt)
+        self._conn.commit()
+
+    """
+    Add a notification for every given comm
+    Without commit, the notification becomes part of the transaction that is currently open on the connection.
+    """
+    def enqueue(self, comms: list[str], msg: str, title: str = None, url: str = None, commit: bool = True):
+        now = Clock().time()
+        with self._lock:
+            self.db.executemany(
+                f'INSERT INTO "{self.DB_TABLE}" (comm, title, msg, url, created, next_attempt) VALUES (?, ?, ?, ?, ?, ?)',
+                [(comm, title, msg, url, now, now) for comm in comms]
+            )
+            if commit:
+                self._conn.commit()
+
+    """Return all notifications that are due, oldest first, as (id, comm, title, msg, url, attempts, created) rows"""
+    def due(self, now: float = None) -> list[tuple]:
+        now = Clock().time() if now is None else now
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT id, comm, title, msg, url, attempts, created FROM "{self.DB_TABLE}" '
+                f'WHERE next_attempt <= ? ORDER BY id',
+                [now]
+            ).fetchall()
+
+    """Remove delivered notifications"""
+    def delivered(self, notification_ids: list[int]):
+        with self._lock:
+            self.db.executemany(f'DELETE FROM "{self.DB_TABLE}" WHERE id = ?', [[i] for i in notification_ids])
+            self._conn.commit()
+
+    """Register a failed delivery and schedule the next attempt"""
+    def failed(self, notification_ids: list[int], error: str, next_attempt: float):
+        with self._lock:
+            self.db.executemany(
+                f'UPDATE "{self.DB_TABLE}" SET attempts = attempts + 1, next_attempt = ?, last_error = ? WHERE id = ?',
+                [[next_attempt, error, i] for i in notification_ids]
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f'SELECT count(*) FROM "{self.DB_TABLE}"').fetchone()[0]
@@ -0,0 +1,99 @@
+import math
+from hashlib import blake2b
+from typing import Iterable
+
+
+def _digest(key: int) -> bytes:
+    return blake2b(key.to_bytes(8, "little", signed=True), digest_size=16).digest()
+
+
+class SeenIndex:
+    """
+    Exact in-memory index of seen listing keys.
+    Keys are the 64-bit integers produced by listing_key(), which are considerably smaller than the urls themselves.
+    """
+
+    # Private attributes
+    _keys: set[int]
+
+    def __init__(self):
+        self._keys = set()
+
+    def add(self, key: int):
+        self._keys.add(key)
+
+    def update(self, keys: Iterable[int]):
+        self._keys.update(keys)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class BloomFilter(SeenIndex):
+    """
+    Bounded-memory index of seen keys.
+    Memory use is fixed by the capacity and error rate. Keys are never reported as unseen once added, but an unseen
+    key is reported as seen with a probability of about error_rate, as long as no more than capacity keys are added.
+    """
+
+    # Public attributes
+    capacity: int
+    error_rate: float
+
+    # Private attributes
+    _bits: bytearray
+    _size: int  # Number of bits
+    _hash_count: int
+    _count: int
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 1e-6):
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self._size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._hash_count = max(round(self._size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self._size + 7) // 8)
+        self._count = 0
+
+    def add(self, key: int):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def update(self, keys: Iterable[int]):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self) -> int:
+        return self._count
+
+    """Derive all bit positions of a key from a single digest using double hashing"""
+    def _positions(self, key: int):
+        digest = _digest(key)
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self._size for i in range(self._hash_count))
+
+
+def make_seen_index(conf: dict | None) -> SeenIndex | None:
+    """Build a seen-index from its configuration section, or return None if it is disabled"""
+    conf = conf or {}
+    mode = conf.get("mode", "set")
+
+    if mode == "set":
+        return SeenIndex()
+    elif mode == "bloom":
+        return BloomFilter(
+            capacity=int(conf.get("capacity", 100_000)),
+            error_rate=float(conf.get("error_rate", 1e-6)),
+        )
+    elif mode in ("none", None):
+        return None
+
+    raise ValueError(f'Config entry seen_index.mode must be one of [set, bloom, none], is now "{mode}"')
@@ -0,0 +1,241 @@
+import logging
+import re
+import sqlite3
+import threading
+import weakref
+from hashlib import blake2b
+from typing import Callable, Iterable
+
+from huizenjacht.config import Config
+from huizenjacht.store.seen_index import SeenIndex, BloomFilter, make_seen_index
+from huizenjacht.utils.clock import Clock
+
+_LISTING_ID = re.compile(r'[/-](\d{7,10})(?=[/-]|$)')
+
+# Schema under which the database of a cluster is attached, see connect()
+SHARED_SCHEMA = "shared"
+
+
+def listing_key(url: str) -> int:
+    """
+    Compact integer key of a listing url
+    This is the numeric listing id in the url if it has one, such as the 4301234 in
+    https://www.funda.nl/detail/koop/enschede/huis-straat-1/4301234/, or a negative 63-bit hash of the url otherwise.
+    """
+    ids = _LISTING_ID.findall(url.split("?")[0])
+    if len(ids) > 0:
+        return int(ids[-1])
+    return -(int.from_bytes(blake2b(url.encode(), digest_size=8).digest(), "little") >> 1) - 1
+
+
+def shared_schema(conn: sqlite3.Connection) -> str:
+    """Schema for state that all nodes of a cluster share: the shared database if one is attached, else main"""
+    attached = {name for _, name, _ in conn.execute("PRAGMA database_list")}
+    return SHARED_SCHEMA if SHARED_SCHEMA in attached else "main"
+
+
+class SeenStore:
+    """
+    Database table that remembers which houses have been seen before.
+    Houses are keyed on their listing id in a compact integer-keyed table, the url is kept alongside if store_urls is
+    enabled. Houses are checked and inserted in batches, each batch costing a single statement and a single commit.
+    An in-memory seen-index in front of the table makes sure only candidate new houses reach the database.
+    Every house records when it was first and last seen. The last seen time of every listed house is refreshed once it
+    is older than touch_interval, so that the retention policy of the Compactor only removes houses that have
+    disappeared from the source. When each house was last refreshed is also kept in memory, so a batch of houses that
+    were all seen recently does not touch the database at all. After the Compactor has removed houses, the seen-index is
+    rebuilt from the table.
+    In a cluster, the table lives in the shared database. Its insert is then an atomic claim: of all nodes that find
+    the same new house, exactly one gets it back from filter_new.
+    Every seen-table is listed in the SeenTables table of its schema, which tells the Compactor what to prune.
+    """
+
+    # Constants
+    MAX_BATCH = 200  # Four parameters per house, stay below SQLite's default limit of 999
+
+    _db_table_create_stmt = '''
+CREATE TABLE IF NOT EXISTS "{schema}"."{table}" (
+	"id"	INTEGER NOT NULL,
+	"URL"	TEXT,
+	"first_seen"	INTEGER NOT NULL DEFAULT 0,
+	"last_seen"	INTEGER NOT NULL DEFAULT 0,
+	PRIMARY KEY("id")
+) WITHOUT ROWID'''
+    _db_index_create_stmt = 'CREATE INDEX IF NOT EXISTS "{schema}"."{table}_last_seen" ON "{table}" ("last_seen")'
+    REGISTRY_TABLE = "SeenTables"
+    _registry_create_stmt = '''
+CREATE TABLE IF NOT EXISTS "{schema}"."SeenTables" (
+	"name"	TEXT NOT NULL,
+	PRIMARY KEY("name")
+) WITHOUT ROWID'''
+
+    # Public attributes
+    logger: logging.Logger
+    table: str
+    schema: str
+    db: sqlite3.Cursor
+
+    # Private attributes
+    _conn: sqlite3.Connection
+    _table_ref: str  # Quoted table name, qualified by its schema
+    _key: Callable[[str], int]
+    _store_urls: bool
+    _touch_interval: float  # seconds
+    _index: SeenIndex | None
+    _touched: dict[int, int]  # Time the last seen time of a house was last refreshed by this store, by key
+    _lock: threading.Lock  # Sources may look up houses from their fetch thread
+    _instances: weakref.WeakSet = weakref.WeakSet()  # All stores, to rebuild their seen-index after compaction
+    _instances_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, db: sqlite3.Connection, table: str, key: Callable[[str], int] = listing_key):
+        self.logger = logging.getLogger(__name__)
+        self.table = table
+        self.schema = shared_schema(db)
+        self._table_ref = f'"{self.schema}"."{table}"'
+
+        self._conn = db
+        self.db = db.cursor()
+        self._key = key
+        self._touched = {}
+        self._lock = threading.Lock()
+
+        self.db.execute(self._db_table_create_stmt.format(schema=self.schema, table=table))
+        self.db.execute(self._db_index_create_stmt.format(schema=self.schema, table=table))
+        self.register(db, table, self.schema)
+        self._conn.commit()
+        if self.schema == SHARED_SCHEMA:
+            self._merge_local()
+
+        server_conf = Config().config["server"]
+        self._store_urls = server_conf.get("store_urls", True)
+        self._touch_interval = (server_conf.get("retention") or {}).get("touch_interval", 24 * 3600)
+        self._index = make_seen_index(server_conf.get("seen_index"))
+        self._warm_index()
+        with self._instances_lock:
+            self._instances.add(self)
+
+    """Add the houses this node saw before it joined the cluster to the shared table, so they are not claimed again"""
+    def _merge_local(self):
+        local = self.db.execute(
+            "SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?", [self.table]
+        ).fetchone()
+        if local is not None:
+            self.db.execute(f'INSERT OR IGNORE INTO {self._table_ref} (id, URL, first_seen, last_seen) '
+                            f'SELECT id, URL, first_seen, last_seen FROM main."{self.table}"')
+            self._conn.commit()
+
+    """List table in the registry of seen-tables of schema, in the open transaction"""
+    @classmethod
+    def register(cls, conn: sqlite3.Connection, table: str, schema: str = "main"):
+        conn.execute(cls._registry_create_stmt.format(schema=schema))
+        conn.execute(f'INSERT OR IGNORE INTO "{schema}"."{cls.REGISTRY_TABLE}" (name) VALUES (?)', [table])
+
+    """
+    Rebuild the seen-index of every store of a table and forget the refresh times of removed houses, e.g. after houses
+    were removed from it
+    The index is built from conn and swapped in as a whole, so this can run in another thread. Houses that are inserted
+    meanwhile may be missing from the new index, which only costs a lookup in the database.
+    """
+    @classmethod
+    def reindex(cls, table_ref: str, conn: sqlite3.Connection):
+        with cls._instances_lock:
+            stores = [s for s in cls._instances if s._table_ref == table_ref]
+        if len(stores) == 0:
+            return
+
+        keys = {key for (key,) in conn.execute(f'SELECT id FROM {table_ref}')}
+        for store in stores:
+            store._touched = {k: t for k, t in list(store._touched.items()) if k in keys}
+            if store._index is None:
+                continue
+            index = make_seen_index(Config().config["server"].get("seen_index"))
+            index.update(keys)
+            store._index = index
+            store.logger.debug(f"Rebuilt the {store.table} seen-index with {len(index)} houses")
+
+    """Load all known houses into the seen-index"""
+    def _warm_index(self):
+        if self._index is None:
+            return
+
+        self._index.update(key for (key,) in self.db.execute(f'SELECT id FROM {self._table_ref}'))
+
+        if isinstance(self._index, BloomFilter) and len(self._index) > self._index.capacity:
+            self.logger.warning(
+                f"{self.table} holds {len(self._index)} houses, more than the seen-index capacity of "
+                f"{self._index.capacity}, false positives will be more frequent than configured"
+            )
+        self.logger.debug(f"Loaded {len(self._index)} houses into the {self.table} seen-index")
+
+    """
+    Insert all houses and return the ones that were not in the database yet, in their original order
+    Without commit, the inserts are left in the transaction that is currently open on the connection.
+    """
+    def filter_new(self, houses: Iterable[str], commit: bool = True) -> list[str]:
+        keyed = {}
+        for house in houses:
+            keyed.setdefault(self._key(house), house)  # Remove duplicates, keep order
+
+        now = int(Clock().time())
+        stale = [k for k in keyed if k not in self._touched or self._touched[k] < now - self._touch_interval]
+        if len(stale) > 0:
+            self._touch(stale, now)
+
+        if self._index is not None:
+            keyed = {k: h for k, h in keyed.items() if k not in self._index}
+        if len(keyed) == 0:
+            if commit:
+                self._conn.commit()
+            return []
+
+        rows = [(k, h if self._store_urls else None, now, now) for k, h in keyed.items()]
+        inserted = set()
+        with self._lock:
+            for i in range(0, len(rows), self.MAX_BATCH):
+                batch = rows[i:i + self.MAX_BATCH]
+                placeholders = ','.join('(?, ?, ?, ?)' for _ in batch)
+                self.db.execute(
+                    f'INSERT OR IGNORE INTO {self._table_ref} (id, URL, first_seen, last_seen) VALUES {placeholders} '
+                    f'RETURNING id',
+                    [value for row in batch for value in row]
+                )
+                inserted.update(row[0] for row in self.db.fetchall())
+
+            if commit:
+                self._conn.commit()
+
+        # Houses that were already in the database are also added, in case the index had drifted
+        if self._index is not None:
+            self._index.update(keyed.keys())
+        self._touched.update(dict.fromkeys(keyed.keys(), now))
+
+        return [h for k, h in keyed.items() if k in inserted]
+
+    """Refresh the last seen time of listed houses where it is older than touch_interval, in the open transaction"""
+    def _touch(self, keys: list[int], now: int):
+        with self._lock:
+            for i in range(0, len(keys), self.MAX_BATCH * 4):
+                batch = keys[i:i + self.MAX_BATCH * 4]
+                self.db.execute(
+                    f'UPDATE {self._table_ref} SET last_seen = ? '
+                    f'WHERE id IN ({",".join("?" for _ in batch)}) AND last_seen < ?',
+                    [now, *batch, now - self._touch_interval]
+                )
+        self._touched.update(dict.fromkeys(keys, now))
+
+    """
+    Check whether a house has been seen before, without inserting it
+    """
+    def contains(self, house: str) -> bool:
+        key = self._key(house)
+        if self._index is not None:
+            return key in self._index
+
+        with self._lock:
+            return self._conn.execute(f'SELECT 1 FROM {self._table_ref} WHERE id = ?', [key]).fetchone() is not None
+
+    """
+    Insert a single house and check whether it was not in the database yet
+    """
+    def is_new(self, house: str) -> bool:
+        return len(self.filter_new([house])) > 0
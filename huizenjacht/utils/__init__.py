@@ -1,4 +1,6 @@
 __all__ = [
+    "Registry",
     "SingletonMeta",
 ]
-from .singleton import SingletonMeta
\ No newline at end of file
+from .registry import Registry
+from .singleton import SingletonMeta
@@ -0,0 +1,55 @@
+import re
+import unicodedata
+
+_POSTCODE = re.compile(r'^(\d{4})\s*([a-z]{2})$')
+_NUMBER = re.compile(r'^(\d+)(.*)$')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase text without accents, with every run of other characters than letters and digits as a single space"""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def split_street(street: str) -> tuple[str, str, str] | None:
+    """
+    Split a street address into its street name, house number and addition
+    The name loses its spaces, so that "Hengelose straat 12 A" and "hengelosestraat-12a" both become
+    ("hengelosestraat", "12", "a"). Returns None if there is no house number.
+    """
+    words = normalize(street).split()
+    for i, word in enumerate(words):
+        match = _NUMBER.match(word)
+        if match is not None and i > 0:
+            return "".join(words[:i]), match.group(1), "".join([match.group(2), *words[i + 1:]])
+    return None
+
+
+def address_keys(street: str = None, city: str = None, postcode: str = None) -> tuple[list[str], str | None]:
+    """
+    Identity keys of an address, and the key to use for fuzzy matching
+    A postcode with house number identifies an address exactly, a street with house number only within a city.
+    Returns no keys if the address is not specific enough.
+    """
+    parts = split_street(street) if street else None
+    if parts is None:
+        return [], None
+    name, number, addition = parts
+
+    keys = []
+    match = _POSTCODE.match(normalize(postcode)) if postcode else None
+    if match is not None:
+        keys.append(f"pc:{match.group(1)}{match.group(2)}|{number}|{addition}")
+
+    street_key = None
+    if city:
+        street_key = f"st:{normalize(city).replace(' ', '')}|{number}|{addition}|{name}"
+        keys.append(street_key)
+    return keys, street_key
+
+
+def ngrams(text: str, n: int = 3) -> set[str]:
+    """All n-grams of text, padded so that its start and end count as well"""
+    text = f" {text} "
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
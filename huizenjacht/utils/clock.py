@@ -0,0 +1,32 @@
+import time
+
+from huizenjacht.utils.singleton import SingletonMeta
+
+
+class Clock(metaclass=SingletonMeta):
+    """
+    Current time for everything that schedules, timestamps or expires something.
+    This is the wall clock, unless simulation is switched on for replay. A simulated clock only moves when it is
+    advanced, so that days of polling can be replayed in seconds. Durations that are measured for metrics and
+    network timeouts always use the real clock.
+    """
+
+    # Private attributes
+    _simulated: float | None = None  # epoch seconds
+
+    """Current time in epoch seconds"""
+    def time(self) -> float:
+        return time.time() if self._simulated is None else self._simulated
+
+    @property
+    def simulated(self) -> bool:
+        return self._simulated is not None
+
+    """Switch to simulated time, starting at start"""
+    def simulate(self, start: float):
+        self._simulated = start
+
+    def advance(self, seconds: float):
+        if self._simulated is None:
+            raise RuntimeError("Only a simulated clock can be advanced")
+        self._simulated += seconds
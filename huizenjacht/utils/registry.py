@@ -0,0 +1,59 @@
+import importlib
+
+
+class Registry:
+    """
+    Maps config keys to plugin classes.
+    Classes are registered as "module:Class" strings relative to a package and only imported on first use, so that
+    the dependencies of inactive plugins are never loaded. Keys are matched ignoring case and underscores.
+    """
+
+    # Public attributes
+    package: str
+
+    # Private attributes
+    _targets: dict[str, str]
+    _loaded: dict[str, type]
+
+    def __init__(self, package: str, targets: dict[str, str] = None):
+        self.package = package
+        self._targets = {}
+        self._loaded = {}
+        for key, target in (targets or {}).items():
+            self.register(key, target)
+
+    """Register a class under key, given as a "module:Class" string or as the class itself"""
+    def register(self, key: str, target: str | type):
+        key = self._normalize(key)
+        if isinstance(target, type):
+            self._loaded[key] = target
+            target = f"{target.__module__}:{target.__name__}"
+        self._targets[key] = target
+
+    """Return the class registered under key, importing its module if needed"""
+    def get(self, key: str) -> type:
+        key = self._normalize(key)
+        if key not in self._loaded:
+            try:
+                module_name, class_name = self._targets[key].split(":")
+            except KeyError:
+                raise KeyError(f"Unknown plugin '{key}' in {self.package}, available are {sorted(self._targets)}")
+            self._loaded[key] = getattr(importlib.import_module(module_name, self.package), class_name)
+        return self._loaded[key]
+
+    """Return the registered class with the given class name, for lazy module attributes"""
+    def get_by_class_name(self, class_name: str) -> type:
+        for key, target in self._targets.items():
+            if target.split(":")[1] == class_name:
+                return self.get(key)
+        raise AttributeError(f"module '{self.package}' has no attribute '{class_name}'")
+
+    def __contains__(self, key: str) -> bool:
+        return self._normalize(key) in self._targets
+
+    def keys(self) -> list[str]:
+        return list(self._targets)
+
+    @staticmethod
+    def _normalize(key: str) -> str:
+        return "".join(c for c in str(key) if c.isalnum()).lower()
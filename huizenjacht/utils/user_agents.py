@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+
+from huizenjacht.config import Config
+from huizenjacht.utils.singleton import SingletonMeta
+
+
+class UserAgentPool(metaclass=SingletonMeta):
+    """
+    Small pool of browser User-Agent strings, kept in a file next to the database.
+    The full fake_useragent dataset is only loaded when the file is missing or older than max_age.
+    """
+
+    # Public attributes
+    logger: logging.Logger
+    conf: dict
+    file: Path
+
+    # Private attributes
+    _agents: list[str]
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+        server_conf = Config().config["server"]
+        self.conf = {
+            "file": Path(server_conf["db"]).parent / "user_agents.json",
+            "size": 50,  # number of User-Agents in the pool
+            "max_age": 30 * 24 * 3600,  # seconds
+        } | server_conf.get("user_agents", {})
+        self.file = Path(self.conf["file"])
+
+        self._agents = self._load() or self._refresh()
+
+    @property
+    def random(self) -> str:
+        return random.choice(self._agents)
+
+    def _load(self) -> list[str] | None:
+        try:
+            if time.time() - self.file.stat().st_mtime > self.conf["max_age"]:
+                return None
+            with open(self.file) as f:
+                agents = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(agents, list) or not agents:
+            return None
+        return agents
+
+    """Build a new pool from the fake_useragent dataset and persist it"""
+    def _refresh(self) -> list[str]:
+        from fake_useragent import UserAgent  # Loads its whole dataset, so only imported when needed
+
+        # Keep the most common ones
+        browsers = sorted(UserAgent().data_browsers, key=lambda b: b["percent"], reverse=True)
+        agents = list(dict.fromkeys(b["useragent"] for b in browsers))[:self.conf["size"]]
+
+        tmp = self.file.with_suffix(".tmp")
+        try:
+            with open(tmp, "w") as f:
+                json.dump(agents, f, indent=0)
+            os.replace(tmp, self.file)
+        except OSError as e:
+            self.logger.warning(f"Could not save User-Agent pool to {self.file}: {e}")
+
+        self.logger.info(f"Refreshed User-Agent pool with {len(agents)} entries")
+        return agents
@@ -0,0 +1,41 @@
+"""
+Parity of the fast ld+json scan with the BeautifulSoup lookup it replaced, on the search pages in benchmark/corpus/
+Run with python -m pytest from the root of the repository.
+"""
+import json
+
+import pytest
+from bs4 import BeautifulSoup
+
+from benchmark.corpus import load_pages
+from huizenjacht.utils.ld_json import LdJsonExtractor, extract_ld_json
+
+PAGES = load_pages()
+
+
+def soup_ld_json(page: str):
+    """The listing block as the original BeautifulSoup implementation found it"""
+    return json.loads("".join(BeautifulSoup(page, features="html.parser")
+                              .find("script", {"type": "application/ld+json"}).contents[0]))
+
+
+def test_corpus_has_pages():
+    assert len(PAGES) > 0
+
+
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_matches_beautifulsoup(name: str):
+    block = extract_ld_json(PAGES[name])
+    assert block is not None
+    assert json.loads(block) == soup_ld_json(PAGES[name])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, 4096])
+@pytest.mark.parametrize("name", sorted(PAGES))
+def test_chunked_feed(name: str, chunk_size: int):
+    page = PAGES[name]
+    extractor = LdJsonExtractor()
+    for start in range(0, len(page), chunk_size):
+        if extractor.feed(page[start:start + chunk_size]):
+            break
+    assert extractor.result == extract_ld_json(page)